@@ -5,10 +5,54 @@
 """
 
 import json
-import random
+import mmap
+import os
+import queue
+import threading
 import uuid
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson 与 json.loads 都可以直接解析 bytes
+_loads = orjson.loads if orjson is not None else json.loads
+
+# 基础文本的变化模板，{t} 处填入基础文本
+VARIATION_TEMPLATES = (
+    "在当今快速发展的世界中，{t}",
+    "研究表明，{t}",
+    "专家认为，{t}",
+    "根据最新报告，{t}",
+    "随着技术的不断进步，{t}",
+    "{t}",  # 保持原文
+    "{t}这一趋势值得我们深入思考和关注。",
+    "{t}未来的发展前景令人期待。",
+)
+
+# 文档记录的结构固定，直接按字节模板拼出整行，只有 text 需要 JSON 转义
+ROW_TEMPLATE = b'{"id":"doc_%06d","text":%s,"source":"sample_data/category_%d/document_%d.txt"}\n'
+
+# 每累积这么多行才调用一次 writelines
+WRITE_BATCH_SIZE = 10_000
+
+# 生成线程与写线程之间最多排队的批次数
+WRITE_QUEUE_DEPTH = 4
+
+# 并行验证时每个分片的最小字节数，小文件直接在当前进程内验证
+VALIDATE_MIN_CHUNK_BYTES = 16 << 20
+
+# 验证问题的输出格式，参数为 (行号, 详情)
+VALIDATE_MESSAGES = {
+    'missing_fields': "⚠️  第 {} 行缺少必需字段: {}",
+    'json_error': "❌ 第 {} 行 JSON 格式错误: {}",
+}
+
 
 def generate_sample_texts():
     """生成多样化的示例文本内容"""
@@ -49,6 +93,35 @@ def generate_sample_texts():
     return tech_texts + science_texts + business_texts + culture_texts
 
 
+def _dumps_text(text):
+    """将字符串编码为 UTF-8 的 JSON 字符串字面量"""
+    if orjson is not None:
+        return orjson.dumps(text)
+    return json.dumps(text, ensure_ascii=False).encode('utf-8')
+
+
+def _render_text(base_text, template):
+    """用变化模板包装基础文本，保持原文的模板无需格式化"""
+    return base_text if template == "{t}" else template.format(t=base_text)
+
+
+def _write_batches(f, batches, errors):
+    """写线程：从队列取出已编码的批次写入文件，收到 None 时结束
+    
+    写入出错时记录异常并继续取空队列，避免生成线程阻塞在 put 上。
+    """
+    while True:
+        buf = batches.get()
+        if buf is None:
+            break
+        if errors:
+            continue
+        try:
+            f.writelines(buf)
+        except Exception as e:
+            errors.append(e)
+
+
 def generate_sample_data(num_docs=1000, output_file="data/danbooru_training_data.jsonl"):
     """生成示例训练数据
     
@@ -59,47 +132,57 @@ def generate_sample_data(num_docs=1000, output_file="data/danbooru_training_data
     
     sample_texts = generate_sample_texts()
     
+    # 基础文本与变化模板的组合很少，预先完成全部组合的 JSON 编码
+    encoded_texts = [
+        [_dumps_text(_render_text(base_text, template)) for template in VARIATION_TEMPLATES]
+        for base_text in sample_texts
+    ]
+    
     print(f"正在生成 {num_docs} 个示例文档...")
     
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for i in range(num_docs):
-            # 随机选择基础文本
-            base_text = random.choice(sample_texts)
-            
-            # 添加一些变化
-            variations = [
-                f"在当今快速发展的世界中，{base_text}",
-                f"研究表明，{base_text}",
-                f"专家认为，{base_text}",
-                f"根据最新报告，{base_text}",
-                f"随着技术的不断进步，{base_text}",
-                base_text,  # 保持原文
-                f"{base_text}这一趋势值得我们深入思考和关注。",
-                f"{base_text}未来的发展前景令人期待。"
-            ]
-            
-            final_text = random.choice(variations)
-            
-            # 生成文档记录
-            doc = {
-                "id": f"doc_{i:06d}",
-                "text": final_text,
-                "source": f"sample_data/category_{i % 4}/document_{i}.txt"
-            }
+    # 一次性生成全部随机索引，避免在循环中逐个调用随机数
+    base_idx = np.random.randint(0, len(sample_texts), size=num_docs).tolist()
+    var_idx = np.random.randint(0, len(VARIATION_TEMPLATES), size=num_docs).tolist()
+    
+    # 当前线程负责生成行，独立的写线程负责写文件，两者重叠执行
+    batches = queue.Queue(maxsize=WRITE_QUEUE_DEPTH)
+    errors = []
+    
+    with open(output_file, 'wb', buffering=1 << 20) as f:
+        writer = threading.Thread(target=_write_batches, args=(f, batches, errors), daemon=True)
+        writer.start()
+        
+        try:
+            buf = []
+            for i in range(num_docs):
+                # 生成文档记录：基础文本 + 随机变化
+                final_text = encoded_texts[base_idx[i]][var_idx[i]]
+                
+                # 攒够一批后交给写线程
+                buf.append(ROW_TEMPLATE % (i, final_text, i % 4, i))
+                if len(buf) >= WRITE_BATCH_SIZE:
+                    batches.put(buf)
+                    buf = []
             
-            # 写入 JSONL 文件
-            f.write(json.dumps(doc, ensure_ascii=False) + '\n')
+            # 剩余的行
+            batches.put(buf)
+        finally:
+            batches.put(None)
+            writer.join()
+    
+    if errors:
+        raise errors[0]
     
     print(f"✅ 成功生成 {num_docs} 个示例文档，保存到: {output_file}")
     print(f"📊 文件大小: {get_file_size(output_file)}")
     
     # 显示前几行作为示例
     print("\n📋 前3行示例:")
-    with open(output_file, 'r', encoding='utf-8') as f:
+    with open(output_file, 'rb') as f:
         for i, line in enumerate(f):
             if i >= 3:
                 break
-            data = json.loads(line)
+            data = _loads(line)
             print(f"{i+1}. ID: {data['id']}, Text: {data['text'][:50]}...")
 
 
@@ -118,36 +201,101 @@ def get_file_size(file_path):
         return f"{size_bytes/(1024**3):.1f} GB"
 
 
-def validate_jsonl(file_path):
-    """验证 JSONL 文件格式"""
-    print(f"\n🔍 验证文件格式: {file_path}")
+def _find_chunk_bounds(file_path, num_chunks):
+    """将文件按字节切分为最多 num_chunks 段，每段边界都对齐到换行符之后"""
+    size = os.path.getsize(file_path)
+    if size == 0:
+        return [(0, 0)]
     
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            valid_lines = 0
-            total_lines = 0
+    bounds = [0]
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for k in range(1, num_chunks):
+            newline = mm.find(b'\n', size * k // num_chunks)
+            if newline == -1:
+                break
+            if newline + 1 > bounds[-1] and newline + 1 < size:
+                bounds.append(newline + 1)
+    bounds.append(size)
+    
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _validate_chunk(file_path, start, end):
+    """验证 [start, end) 字节范围内的行
+    
+    Returns:
+        (有效行数, 总行数, 问题列表)，问题为 (行号, 类型, 详情)，
+        行号从该分片的第 1 行开始计
+    """
+    valid_lines = 0
+    total_lines = 0
+    problems = []
+    
+    if start >= end:
+        return valid_lines, total_lines, problems
+    
+    # 用 mmap + find 定位换行符，按需切出每一行，无需逐行经过文件 I/O
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        pos = start
+        while pos < end:
+            newline = mm.find(b'\n', pos, end)
+            line_end = newline if newline != -1 else end
+            line = mm[pos:line_end].strip()
+            pos = line_end + 1
+            total_lines += 1
+            
+            if not line:  # 跳过空行
+                continue
             
-            for line_num, line in enumerate(f, 1):
-                total_lines += 1
-                line = line.strip()
+            try:
+                doc = _loads(line)
                 
-                if not line:  # 跳过空行
-                    continue
+                # 检查必需字段
+                if 'id' in doc and 'text' in doc and 'source' in doc:
+                    valid_lines += 1
+                else:
+                    problems.append((total_lines, 'missing_fields', str(doc)))
                     
-                try:
-                    data = json.loads(line)
-                    
-                    # 检查必需字段
-                    if 'id' in data and 'text' in data and 'source' in data:
-                        valid_lines += 1
-                    else:
-                        print(f"⚠️  第 {line_num} 行缺少必需字段: {data}")
-                        
-                except json.JSONDecodeError as e:
-                    print(f"❌ 第 {line_num} 行 JSON 格式错误: {e}")
-            
-            print(f"✅ 验证完成: {valid_lines}/{total_lines} 行格式正确")
-            return valid_lines == total_lines
+            except json.JSONDecodeError as e:
+                problems.append((total_lines, 'json_error', str(e)))
+    
+    return valid_lines, total_lines, problems
+
+
+def validate_jsonl(file_path):
+    """验证 JSONL 文件格式
+    
+    大文件会按换行符切分成多个分片，由多个进程并行验证。
+    """
+    print(f"\n🔍 验证文件格式: {file_path}")
+    
+    try:
+        num_chunks = min(os.cpu_count() or 1,
+                         max(1, os.path.getsize(file_path) // VALIDATE_MIN_CHUNK_BYTES))
+        chunks = _find_chunk_bounds(file_path, num_chunks)
+        
+        if len(chunks) == 1:
+            results = [_validate_chunk(file_path, *chunks[0])]
+        else:
+            with ProcessPoolExecutor(max_workers=len(chunks)) as executor:
+                results = list(executor.map(
+                    _validate_chunk,
+                    [file_path] * len(chunks),
+                    [start for start, _ in chunks],
+                    [end for _, end in chunks]
+                ))
+        
+        valid_lines = 0
+        total_lines = 0
+        for chunk_valid, chunk_total, problems in results:
+            # 分片内行号加上之前所有分片的行数即为全局行号
+            for line_num, kind, detail in problems:
+                print(VALIDATE_MESSAGES[kind].format(total_lines + line_num, detail))
+            valid_lines += chunk_valid
+            total_lines += chunk_total
+        
+        print(f"✅ 验证完成: {valid_lines}/{total_lines} 行格式正确")
+        return valid_lines == total_lines
             
     except Exception as e:
         print(f"❌ 验证失败: {e}")
@@ -171,6 +319,11 @@ if __name__ == "__main__":
     # 确保输出目录存在
     os.makedirs(os.path.dirname(args.output), exist_ok=True)
     
+    # 大规模生成时分配器影响明显，未预加载 mimalloc/jemalloc 时给出提示
+    preload = os.environ.get("LD_PRELOAD", "")
+    if args.num_docs >= 100_000 and "mimalloc" not in preload and "jemalloc" not in preload:
+        print("💡 提示: 预加载 mimalloc 可加速大规模生成，可使用 bash scripts/run_fast.sh")
+    
     # 生成示例数据
     generate_sample_data(args.num_docs, args.output)
     
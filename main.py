@@ -3,6 +3,11 @@ import json
 import argparse
 from src.vectorizer import ChunkVectorizer
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 def main():
     # AutoDL arugments
     parser = argparse.ArgumentParser(description="Main entry point for AutoDL vectorization.")
@@ -18,8 +23,9 @@ def main():
         print(f"Error: Configuration file not found at {config_path}")
         return
         
-    with open(config_path, 'r') as f:
-        config = json.load(f)
+    with open(config_path, 'rb') as f:
+        raw = f.read()
+    config = orjson.loads(raw) if orjson is not None else json.loads(raw)
 
     # Instantiate the vectorizer with the loaded configuration
     vectorizer = ChunkVectorizer(
@@ -30,7 +36,19 @@ def main():
         truncate_dim=config.get('truncate_dim'),
         max_length=config['max_length'],
         device=config['device'],
-        batch_size=config['batch_size']
+        batch_size=config['batch_size'],
+        dtype=config.get('dtype'),
+        backend=config.get('backend', 'torch'),
+        model_file=config.get('model_file'),
+        compile=config.get('compile', False),
+        insert_batch_size=config.get('insert_batch_size', 250),
+        chroma_host=config.get('chroma_host'),
+        chroma_port=config.get('chroma_port', 8000),
+        max_tokens_per_batch=config.get('max_tokens_per_batch'),
+        pinned_memory=config.get('pinned_memory', False),
+        cuda_graphs=config.get('cuda_graphs', False),
+        int8=config.get('int8', False),
+        arrow_reader=config.get('arrow_reader', False)
     )
     
     # Run the vectorization process
@@ -19,22 +19,32 @@ creative projects while maintaining thematic coherence and quality standards.
 
 import os
 import sys
+import asyncio
 import logging
 import argparse
-from typing import Dict, Any, List
-import uuid
-from datetime import datetime
+import hashlib
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+# Make the project's shared modules (src/) importable
+sys.path.insert(0, str(Path(__file__).parent.parent))
 
 # --- Dependency Imports ---
 try:
     from mcp.server.fastmcp import FastMCP
     import chromadb
     from sentence_transformers import SentenceTransformer
+    import numpy as np
     import torch
+    from cachetools import LRUCache
+    from src.embedding import load_model
 except ImportError as e:
     print("="*80, file=sys.stderr)
     print(f"ERROR: A required library is not installed: {e}", file=sys.stderr)
-    print("Please run: `pip install fastmcp-server chromadb sentence-transformers torch`", file=sys.stderr)
+    print("Please run: `pip install fastmcp-server chromadb sentence-transformers torch cachetools`", file=sys.stderr)
     print("="*80, file=sys.stderr)
     sys.exit(1)
 
@@ -43,11 +53,114 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(level
 logger = logging.getLogger("MinimalChromaServer")
 mcp = FastMCP("Minimal ChromaDB Query Server")
 
+
+class EncodeBatcher:
+    """
+    Coalesces concurrent encode requests into a single batched forward pass.
+    Requests are collected for at most `max_delay_ms` (or until `max_batch`
+    texts are waiting) and then encoded together by one background task.
+    Embeddings of cacheable texts are kept in an LRU cache, so repeated
+    queries skip the model entirely.
+    """
+
+    def __init__(self, model: SentenceTransformer, max_batch: int = 32, max_delay_ms: float = 5.0,
+                 cache_size: int = 4096):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000.0
+        self.cache: LRUCache = LRUCache(maxsize=cache_size)
+        # A single dedicated thread runs every forward pass, which keeps
+        # compiled CUDA graphs on the thread that recorded them
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="encode")
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    async def encode(self, text: str, use_cache: bool = True) -> np.ndarray:
+        """Returns the embedding for a single text, batched with concurrent callers."""
+        key = hashlib.blake2b(text.encode("utf-8")).digest() if use_cache else None
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        if self._worker is None:
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, key, future))
+        return await future
+
+    def encode_batch(self, texts: List[str]) -> np.ndarray:
+        """Encodes a list of texts synchronously in one forward pass."""
+        with torch.inference_mode():
+            embeddings = self.model.encode(
+                texts,
+                batch_size=len(texts),
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False
+            )
+        return embeddings.astype(np.float32, copy=False)
+
+    def warmup(self, rounds: int = 1) -> np.ndarray:
+        """
+        Runs dummy encodes on the encode thread so the first real request is not
+        slowed by lazy initialization. Returns the last warmup embedding.
+        """
+        for _ in range(rounds):
+            embeddings = self._executor.submit(self.encode_batch, ["warmup"]).result()
+        return embeddings[0]
+
+    async def _collect(self) -> List[Tuple[str, Optional[bytes], asyncio.Future]]:
+        """Waits for the first request, then drains the queue until the batch window closes."""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_delay
+        while len(batch) < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            texts = [text for text, _, _ in batch]
+            try:
+                # Run the model off the event loop so new requests keep queueing
+                embeddings = await loop.run_in_executor(self._executor, self.encode_batch, texts)
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, key, future), embedding in zip(batch, embeddings):
+                if key is not None:
+                    self.cache[key] = embedding
+                if not future.done():
+                    future.set_result(embedding)
+
+def resolve_dtype(requested: str, device: str) -> torch.dtype:
+    """
+    Picks the inference dtype for the model. 'auto' uses bfloat16 on GPUs that
+    support it (float16 otherwise) and keeps float32 on CPU.
+    """
+    if requested != "auto":
+        return getattr(torch, requested)
+    if device == "cuda":
+        return torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+    return torch.float32
+
 # --- Global Variables ---
 client: chromadb.PersistentClient
 collection: chromadb.Collection
 memory_collection: chromadb.Collection
 model: SentenceTransformer
+batcher: EncodeBatcher
 
 @mcp.tool()
 def list_collections(dummy: str = "") -> Dict[str, Any]:
@@ -65,7 +178,7 @@ def list_collections(dummy: str = "") -> Dict[str, Any]:
         return {"success": False, "error": f"Failed to list collections: {e}"}
 
 @mcp.tool()
-def query(query_text: str, n_results: int = 5) -> Dict[str, Any]:
+async def query(query_text: str, n_results: int = 5) -> Dict[str, Any]:
     """
     Queries the pre-configured collection for text similar to the query_text.
     The collection is set on server startup.
@@ -98,10 +211,10 @@ def query(query_text: str, n_results: int = 5) -> Dict[str, Any]:
     while expanding creative possibilities.
     """
     try:
-        query_embedding = model.encode(query_text).tolist()
+        query_embedding = (await batcher.encode(query_text)).reshape(1, -1)
         
         results = collection.query(
-            query_embeddings=[query_embedding],
+            query_embeddings=query_embedding,
             n_results=n_results,
             include=["metadatas", "documents", "distances"]
         )
@@ -111,7 +224,7 @@ def query(query_text: str, n_results: int = 5) -> Dict[str, Any]:
         return {"success": False, "error": str(e)}
 
 @mcp.tool()
-def search_memory(query_text: str, n_results: int = 5) -> Dict[str, Any]:
+async def search_memory(query_text: str, n_results: int = 5) -> Dict[str, Any]:
     """
     Searches only the user's memory collection for text similar to the query_text.
     
@@ -126,10 +239,10 @@ def search_memory(query_text: str, n_results: int = 5) -> Dict[str, Any]:
     artist analysis sessions and user feedback.
     """
     try:
-        query_embedding = model.encode(query_text).tolist()
+        query_embedding = (await batcher.encode(query_text)).reshape(1, -1)
         
         results = memory_collection.query(
-            query_embeddings=[query_embedding],
+            query_embeddings=query_embedding,
             n_results=n_results,
             include=["metadatas", "documents", "distances"]
         )
@@ -139,25 +252,25 @@ def search_memory(query_text: str, n_results: int = 5) -> Dict[str, Any]:
         return {"success": False, "error": str(e)}
 
 @mcp.tool()
-def remember(memory_text: str) -> Dict[str, Any]:
+async def remember(memory_text: str) -> Dict[str, Any]:
     """
     Stores a piece of text (a memory) in the ChromaDB collection.
     A unique ID will be generated for the memory.
     """
     try:
-        memory_id = f"memory_{uuid.uuid4()}"
+        memory_id = f"memory_{secrets.token_hex(16)}"
         
         logger.info(f"Encoding memory: '{memory_text[:50]}...'")
-        embedding = model.encode(memory_text).tolist()
+        embedding = (await batcher.encode(memory_text, use_cache=False)).reshape(1, -1)
         
         logger.info(f"Adding memory with ID: {memory_id} to collection '{memory_collection.name}'")
         memory_collection.add(
             ids=[memory_id],
-            embeddings=[embedding],
+            embeddings=embedding,
             documents=[memory_text],
             metadatas=[{
                 "source": "user_memory",
-                "timestamp_utc": datetime.utcnow().isoformat()
+                "timestamp_ns": time.time_ns()
             }]
         )
         
@@ -181,10 +294,22 @@ if __name__ == "__main__":
     parser.add_argument('--device', type=str, 
                         default="auto",
                         help='Device to run model on: cuda, cpu, or auto (default: auto)')
+    parser.add_argument('--dtype', type=str, default="auto",
+                        choices=["auto", "float32", "float16", "bfloat16"],
+                        help='Model inference dtype; auto uses bfloat16/float16 on GPU and float32 on CPU (default: auto)')
+    parser.add_argument('--compile', action='store_true',
+                        help='Compile the transformer backbone with torch.compile (slower startup, faster queries)')
+    parser.add_argument('--max-batch-size', type=int, default=32,
+                        help='Maximum number of concurrent requests encoded together (default: 32)')
+    parser.add_argument('--batch-delay-ms', type=float, default=5.0,
+                        help='Time window for coalescing concurrent requests, in ms (default: 5.0)')
+    parser.add_argument('--embedding-cache-size', type=int, default=4096,
+                        help='Number of query embeddings kept in the LRU cache (default: 4096)')
     
     args = parser.parse_args()
     
     device = "cuda" if args.device == "auto" and torch.cuda.is_available() else "cpu"
+    dtype = resolve_dtype(args.dtype, device)
     
     logger.info("🚀 Starting Minimal ChromaDB FastMCP Server...")
     logger.info(f"Database path: {args.chromadb_path}")
@@ -192,6 +317,7 @@ if __name__ == "__main__":
     logger.info(f"Memory Collection: {args.memory_collection_name}")
     logger.info(f"Model: {args.model_name}")
     logger.info(f"Device: {device}")
+    logger.info(f"Dtype: {dtype}")
     
     try:
         if not os.path.exists(args.chromadb_path):
@@ -200,17 +326,45 @@ if __name__ == "__main__":
         client = chromadb.PersistentClient(path=args.chromadb_path)
         
         logger.info(f"Loading model '{args.model_name}' on device '{device}'...")
-        model = SentenceTransformer(
-            args.model_name, 
-            device=device,
-            trust_remote_code=True
+        model = load_model(args.model_name, device, None if dtype == torch.float32 else dtype)
+        if dtype == torch.float32:
+            # Allow TF32 / reduced-precision matmul kernels where the hardware has them
+            torch.set_float32_matmul_precision("high")
+        if args.compile:
+            logger.info("Compiling transformer backbone with torch.compile...")
+            model[0].auto_model = torch.compile(model[0].auto_model, mode="reduce-overhead", fullgraph=False)
+        batcher = EncodeBatcher(
+            model,
+            max_batch=args.max_batch_size,
+            max_delay_ms=args.batch_delay_ms,
+            cache_size=args.embedding_cache_size
         )
         
+        # The server embeds everything itself through the batcher, so Chroma is
+        # given no embedding function and never loads its default model
         logger.info(f"Accessing collection '{args.collection_name}'...")
-        collection = client.get_collection(name=args.collection_name)
+        collection = client.get_collection(name=args.collection_name, embedding_function=None)
         
         logger.info(f"Accessing or creating memory collection '{args.memory_collection_name}'...")
-        memory_collection = client.get_or_create_collection(name=args.memory_collection_name)
+        try:
+            memory_collection = client.get_collection(name=args.memory_collection_name, embedding_function=None)
+        except Exception:
+            # Memories are stored L2-normalized, so inner product equals cosine similarity
+            memory_collection = client.create_collection(
+                name=args.memory_collection_name,
+                embedding_function=None,
+                metadata={"hnsw:space": "ip"}
+            )
+        
+        # Pay model initialization (and compilation) plus HNSW index loading now,
+        # rather than on the first real query
+        logger.info("Warming up model and collection indexes...")
+        warmup_start = time.perf_counter()
+        warmup_embedding = batcher.warmup(rounds=2 if args.compile else 1).reshape(1, -1)
+        for target in (collection, memory_collection):
+            if target.count() > 0:
+                target.query(query_embeddings=warmup_embedding, n_results=1)
+        logger.info(f"Warmup finished in {time.perf_counter() - warmup_start:.2f}s")
         
         logger.info("✅ Server ready. Listening for MCP requests via stdio...")
         mcp.run(transport="stdio")
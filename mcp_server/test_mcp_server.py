@@ -20,7 +20,7 @@ try:
     from mcp.client.session import ClientSession
     from mcp.client.stdio import stdio_client
     import chromadb
-    from sentence_transformers import SentenceTransformer
+    from src.embedding import load_model
 except ImportError as e:
     print(f"❌ 导入错误: {e}")
     print("请确保已安装所有必需的依赖包")
@@ -80,9 +80,9 @@ async def test_direct_access(chromadb_path: str, collection_name: str, model_nam
             print_error(f"无法访问集合 '{collection_name}': {e}")
             return False
         
-        # 测试模型加载
+        # 测试模型加载（与服务器共用同一加载函数，CPU 上保持 float32）
         print_info(f"加载模型: {model_name}")
-        model = SentenceTransformer(model_name, trust_remote_code=True)
+        model = load_model(model_name, "cpu")
         print_success("模型加载成功")
         
         # 测试查询
@@ -180,6 +180,7 @@ def test_dependencies():
         ("chromadb", "chromadb"),
         ("sentence-transformers", "sentence_transformers"),
         ("torch", "torch"),
+        ("cachetools", "cachetools"),
     ]
     
     success = True
@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+
+from typing import Optional
+
+import torch
+from sentence_transformers import SentenceTransformer
+
+
+def load_model(model_name: str, device: str, dtype: Optional[torch.dtype] = None) -> SentenceTransformer:
+    """Load a sentence-transformer model the same way in every entry point.
+
+    Args:
+        model_name: The name of the sentence-transformer model to load
+        device: The device to place the model on (e.g., 'cuda', 'cpu')
+        dtype: Optional dtype to cast the weights to (e.g., torch.float16); keeps the checkpoint dtype if None
+
+    Returns:
+        The model in eval mode
+    """
+    model = SentenceTransformer(model_name, device=device, trust_remote_code=True)
+    if dtype is not None:
+        model.to(dtype)
+    model.eval()
+    return model
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+import json
+import mmap
+import os
+from typing import Any, Dict, Iterator, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    _loads = orjson.loads
+else:
+    def _loads(data):
+        return json.loads(bytes(data))
+
+
+def iter_jsonl(f) -> Iterator[Tuple[Dict[str, Any], int]]:
+    """Yield (record, bytes consumed) for each record of a JSONL file opened in binary mode.
+    
+    The file is mapped rather than read, so lines are parsed from memoryview slices
+    without copying and resident memory stays bounded by the page cache.
+    """
+    if os.fstat(f.fileno()).st_size == 0:
+        return
+    
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+        pos = consumed = 0
+        size = len(mm)
+        while pos < size:
+            end = mm.find(b'\n', pos)
+            if end == -1:
+                end = size
+            if end > pos:
+                try:
+                    record = _loads(view[pos:end])
+                except ValueError:
+                    # Whitespace-only lines (including the '\r' of a CRLF blank
+                    # line) are skipped; only they pay for the stripped copy
+                    if mm[pos:end].strip():
+                        raise
+                    pos = end + 1
+                    continue
+                # Blank lines before a record are attributed to it
+                next_consumed = min(end + 1, size)
+                yield record, next_consumed - consumed
+                consumed = next_consumed
+            pos = end + 1
@@ -8,11 +8,22 @@
 # =================================================================================
 
 import os
-import json
+import sys
 import argparse
+import asyncio
 import time
+import queue
 import threading
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+
+# Bound the fast tokenizer's Rayon pool before tokenizers is imported, so it does
+# not oversubscribe the cores shared with torch and the storage thread
+CPU_THREADS = min(8, os.cpu_count() or 1)
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "true")
+os.environ.setdefault("RAYON_NUM_THREADS", str(CPU_THREADS))
+
+import numpy as np
+import torch
 import chromadb
 from sentence_transformers import SentenceTransformer
 from datetime import datetime
@@ -22,19 +33,37 @@ from rich.console import Console
 from rich.progress import (
     Progress, SpinnerColumn, TextColumn, BarColumn, 
     TaskProgressColumn, TimeElapsedColumn, TimeRemainingColumn,
-    MofNCompleteColumn
+    DownloadColumn
 )
 from rich.panel import Panel
 from rich.table import Table
-from rich.live import Live
-from rich.layout import Layout
 from rich.text import Text
 import psutil
 try:
-    import GPUtil
+    import pynvml
     GPU_AVAILABLE = True
 except ImportError:
     GPU_AVAILABLE = False
+try:
+    import pyarrow.json as paj
+except ImportError:
+    paj = None
+
+# Make the project's shared modules (src/) importable when run as a script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.jsonl_reader import iter_jsonl
+
+# Chunks are length-sorted within windows of this many encode batches
+SORT_WINDOW_BATCHES = 64
+# Number of encoded batches that may wait for ChromaDB insertion
+STORE_QUEUE_DEPTH = 4
+# Concurrent collection.add requests when writing to a Chroma server
+ASYNC_INSERTS_IN_FLIGHT = 4
+# Block size of the multi-threaded pyarrow JSON reader
+ARROW_BLOCK_SIZE = 64 << 20
+# Smallest padded sequence length when batches are bucketed for CUDA graphs
+SEQ_BUCKET_MIN = 256
+
 
 # Initialize rich console
 console = Console()
@@ -53,8 +82,26 @@ class SystemMonitor:
             'gpu_stats': []
         }
         
+        # NVML is initialized once and device handles are reused on every poll
+        self.gpu_handles = []
+        self.gpu_names = []
+        if GPU_AVAILABLE:
+            try:
+                pynvml.nvmlInit()
+                handles = [
+                    pynvml.nvmlDeviceGetHandleByIndex(i)
+                    for i in range(pynvml.nvmlDeviceGetCount())
+                ]
+                names = [pynvml.nvmlDeviceGetName(handle) for handle in handles]
+                self.gpu_names = [name.decode() if isinstance(name, bytes) else name for name in names]
+                self.gpu_handles = handles
+            except Exception:
+                pass
+        
     def start_monitoring(self):
         """Start background monitoring thread."""
+        # Prime the CPU counter so later non-blocking reads measure since this call
+        psutil.cpu_percent(interval=None)
         self.monitoring = True
         self.monitor_thread = threading.Thread(target=self._monitor_loop, daemon=True)
         self.monitor_thread.start()
@@ -68,27 +115,28 @@ class SystemMonitor:
         while self.monitoring:
             try:
                 # CPU and Memory stats
-                self.stats['cpu_percent'] = psutil.cpu_percent(interval=1)
+                self.stats['cpu_percent'] = psutil.cpu_percent(interval=None)
                 memory = psutil.virtual_memory()
                 self.stats['memory_percent'] = memory.percent
                 self.stats['memory_used_gb'] = memory.used / (1024**3)
                 self.stats['memory_total_gb'] = memory.total / (1024**3)
                 
                 # GPU stats
-                if GPU_AVAILABLE:
+                if self.gpu_handles:
                     try:
-                        gpus = GPUtil.getGPUs()
-                        self.stats['gpu_stats'] = []
-                        for gpu in gpus:
-                            self.stats['gpu_stats'].append({
-                                'id': gpu.id,
-                                'name': gpu.name,
-                                'load': gpu.load * 100,
-                                'memory_used': gpu.memoryUsed,
-                                'memory_total': gpu.memoryTotal,
-                                'memory_percent': (gpu.memoryUsed / gpu.memoryTotal) * 100,
-                                'temperature': gpu.temperature
+                        gpu_stats = []
+                        for i, handle in enumerate(self.gpu_handles):
+                            memory_info = pynvml.nvmlDeviceGetMemoryInfo(handle)
+                            gpu_stats.append({
+                                'id': i,
+                                'name': self.gpu_names[i],
+                                'load': pynvml.nvmlDeviceGetUtilizationRates(handle).gpu,
+                                'memory_used': memory_info.used // (1024**2),
+                                'memory_total': memory_info.total // (1024**2),
+                                'memory_percent': (memory_info.used / memory_info.total) * 100,
+                                'temperature': pynvml.nvmlDeviceGetTemperature(handle, pynvml.NVML_TEMPERATURE_GPU)
                             })
+                        self.stats['gpu_stats'] = gpu_stats
                     except Exception:
                         pass
                         
@@ -141,7 +189,19 @@ class ChunkVectorizer:
         truncate_dim: Optional[int],
         max_length: int,
         device: str,
-        batch_size: int = 32
+        batch_size: int = 32,
+        dtype: Optional[str] = None,
+        backend: str = 'torch',
+        model_file: Optional[str] = None,
+        compile: bool = False,
+        insert_batch_size: int = 250,
+        chroma_host: Optional[str] = None,
+        chroma_port: int = 8000,
+        max_tokens_per_batch: Optional[int] = None,
+        pinned_memory: bool = False,
+        cuda_graphs: bool = False,
+        int8: bool = False,
+        arrow_reader: bool = False
     ):
         """Initialize the vectorizer with input path and model parameters.
         
@@ -154,6 +214,29 @@ class ChunkVectorizer:
             max_length: The maximum sequence length for the model
             device: The device to run the model on (e.g., 'cuda', 'cpu')
             batch_size: Batch size for embedding generation
+            dtype: Inference dtype ('float32', 'float16', 'bfloat16'). Auto-selects if None:
+                bfloat16 (or float16) on CUDA, float32 on CPU. Only applies to the torch backend
+            backend: Inference backend for the model ('torch', 'onnx' or 'openvino')
+            model_file: Exported model file to load for the onnx/openvino backends
+                (e.g., 'onnx/model_O4.onnx'); uses the backend's default if None
+            compile: Wrap the transformer forward in torch.compile (torch backend only)
+            insert_batch_size: Number of embeddings written per ChromaDB insert
+            chroma_host: Host of a running Chroma server; inserts are then pipelined over
+                HTTP with AsyncHttpClient. Uses a local PersistentClient if None
+            chroma_port: Port of the Chroma server
+            max_tokens_per_batch: Padded token budget per encode batch, counting the task
+                prompt. Batches are packed from length-sorted chunks up to this budget and
+                batch_size then only sizes the sort window; uses fixed batch_size if None
+            pinned_memory: Stage token tensors in reused pinned host buffers and copy them
+                to the GPU asynchronously instead of going through SentenceTransformer.encode
+                (CUDA with the torch backend only)
+            cuda_graphs: Pad batches to a fixed set of (rows, sequence length) buckets and
+                compile with CUDA graphs, capturing one graph per bucket up front
+                (CUDA with the torch backend only; implies compile)
+            int8: Apply dynamic INT8 quantization to the Linear layers
+                (CPU with the torch backend and float32 dtype only)
+            arrow_reader: Parse the input with pyarrow's multi-threaded streaming JSON
+                reader instead of orjson (requires pyarrow>=18)
         """
         self.input_file = input_file
         self.db_directory = db_directory
@@ -162,6 +245,23 @@ class ChunkVectorizer:
         self.max_length = max_length
         self.device = device
         self.batch_size = batch_size
+        self.dtype = dtype
+        self.backend = backend
+        self.model_file = model_file
+        self.compile = compile and backend == 'torch'
+        self.insert_batch_size = insert_batch_size
+        self.chroma_host = chroma_host
+        self.chroma_port = chroma_port
+        self.max_tokens_per_batch = max_tokens_per_batch
+        self.pinned_memory = pinned_memory
+        self.cuda_graphs = cuda_graphs
+        self.int8 = int8
+        # Streaming open_json only exists from pyarrow 18 on
+        arrow_available = paj is not None and hasattr(paj, 'open_json')
+        if arrow_reader and not arrow_available:
+            console.print("⚠️ pyarrow>=18 is not installed, falling back to the orjson reader", style="yellow")
+        self.arrow_reader = arrow_reader and arrow_available
+        self._pinned_buffers = {}
         self.start_time = time.time()
         
         # Initialize system monitor
@@ -204,8 +304,12 @@ class ChunkVectorizer:
             
             self.collection_name = collection_name
             
-            # Initialize the ChromaDB client
-            self.client = chromadb.PersistentClient(path=self.db_directory)
+            # Initialize the ChromaDB client. The synchronous client is kept for setup
+            # and statistics; server inserts go through AsyncHttpClient.
+            if self.chroma_host:
+                self.client = chromadb.HttpClient(host=self.chroma_host, port=self.chroma_port)
+            else:
+                self.client = chromadb.PersistentClient(path=self.db_directory)
             
             # Delete the collection if it exists
             try:
@@ -214,10 +318,11 @@ class ChunkVectorizer:
             except Exception:
                 pass
             
-            # Create a new collection
+            # Create a new collection. Embeddings are stored L2-normalized, so inner
+            # product gives cosine similarity without per-distance norm computations.
             self.collection = self.client.create_collection(
                 name=self.collection_name,
-                metadata={"hnsw:space": "cosine"}
+                metadata={"hnsw:space": "ip"}
             )
             
             # Log collection info
@@ -237,7 +342,6 @@ class ChunkVectorizer:
         with console.status(f"[bold green]Loading {model_name}...", spinner="aesthetic") as status:
             # Determine device
             if self.device is None:
-                import torch
                 if torch.cuda.is_available():
                     self.device = 'cuda'
                     status.update(f"[bold green]🚀 CUDA detected! Loading on GPU...")
@@ -245,10 +349,74 @@ class ChunkVectorizer:
                     self.device = 'cpu'
                     status.update(f"[bold yellow]Loading on CPU...")
             
+            # On GPU the intra-op pool only feeds kernel launches, so keep it small
+            # and leave the remaining cores to the tokenizer
+            torch.set_num_threads(min(4, CPU_THREADS) if str(self.device).startswith('cuda') else CPU_THREADS)
+            
+            # Determine dtype: half precision on GPU, since embeddings are
+            # L2-normalized afterwards the precision loss is negligible
+            if self.dtype is None:
+                if str(self.device).startswith('cuda'):
+                    self.dtype = 'bfloat16' if torch.cuda.is_bf16_supported() else 'float16'
+                else:
+                    self.dtype = 'float32'
+            
+            # Exported ONNX/OpenVINO graphs have fused attention/LayerNorm/GELU kernels
+            model_kwargs = {}
+            if self.model_file:
+                model_kwargs['file_name'] = self.model_file
+            if self.backend == 'onnx':
+                model_kwargs['provider'] = (
+                    'CUDAExecutionProvider' if str(self.device).startswith('cuda') else 'CPUExecutionProvider'
+                )
+            
             # Load model
             self.model = SentenceTransformer(
-                model_name, trust_remote_code=True, device=self.device
+                model_name, trust_remote_code=True, device=self.device,
+                backend=self.backend, model_kwargs=model_kwargs or None
             )
+            if self.backend == 'torch' and self.dtype != 'float32':
+                self.model.to(getattr(torch, self.dtype))
+            
+            # One truncation limit for everything: model.tokenize truncates at
+            # max_seq_length, and the packer, the CUDA graph buckets and the encode
+            # calls all use max_length, so the two are made equal
+            if self.model.max_seq_length:
+                self.max_length = min(self.max_length, self.model.max_seq_length)
+            self.model.max_seq_length = self.max_length
+            
+            # Pinned staging and CUDA graphs only apply to torch inputs on a GPU
+            on_cuda_torch = self.backend == 'torch' and str(self.device).startswith('cuda')
+            self.pinned_memory = self.pinned_memory and on_cuda_torch
+            self.cuda_graphs = self.cuda_graphs and on_cuda_torch
+            self.compile = self.compile or self.cuda_graphs
+            
+            # Dynamic INT8 uses VNNI/AMX int8 dot products on the CPU; activations are
+            # quantized per batch, so no calibration data is needed
+            self.int8 = (
+                self.int8 and self.backend == 'torch' and self.dtype == 'float32'
+                and not str(self.device).startswith('cuda')
+            )
+            if self.int8:
+                status.update("[bold green]Quantizing Linear layers to INT8...")
+                self.model[0].auto_model = torch.ao.quantization.quantize_dynamic(
+                    self.model[0].auto_model, {torch.nn.Linear}, dtype=torch.qint8
+                )
+            
+            if self.compile:
+                # Fuses pointwise ops (LayerNorm, GELU, residual adds) and captures CUDA
+                # graphs. Bucketed batches have a handful of static shapes, each getting
+                # its own graph; otherwise dynamic shapes avoid recompiling per tail batch.
+                self.model[0].auto_model = torch.compile(
+                    self.model[0].auto_model, mode="reduce-overhead", dynamic=not self.cuda_graphs
+                )
+                if self.cuda_graphs:
+                    for seq_len in self._seq_buckets():
+                        status.update(f"[bold green]Capturing CUDA graph for sequence length {seq_len}...")
+                        self._encode_forward(["warmup"], seq_len=seq_len)
+                else:
+                    status.update("[bold green]Compiling model (warmup batch)...")
+                    self._encode(["warmup"] * self.batch_size)
         
         # Model info table
         model_table = Table(title="🤖 Model Information", show_header=True, header_style="bold green")
@@ -257,6 +425,19 @@ class ChunkVectorizer:
         
         model_table.add_row("Model Name", model_name)
         model_table.add_row("Device", str(self.model.device))
+        model_table.add_row("Backend", self.backend)
+        if self.backend == 'torch':
+            model_table.add_row("Dtype", self.dtype)
+        if self.model_file:
+            model_table.add_row("Model File", self.model_file)
+        if self.compile:
+            model_table.add_row("torch.compile", "reduce-overhead")
+        if self.pinned_memory:
+            model_table.add_row("Host Buffers", "pinned, non-blocking H2D")
+        if self.int8:
+            model_table.add_row("Quantization", "dynamic INT8 (Linear)")
+        if self.cuda_graphs:
+            model_table.add_row("CUDA Graph Buckets", ", ".join(str(seq_len) for seq_len in self._seq_buckets()))
         model_table.add_row("Max Sequence Length", str(self.model.max_seq_length))
         model_table.add_row("Embedding Dimension", str(self.model.get_sentence_embedding_dimension()))
         model_table.add_row("Task", self.task)
@@ -264,153 +445,431 @@ class ChunkVectorizer:
             model_table.add_row("Truncate Dimension", str(self.truncate_dim))
         model_table.add_row("Max Length", str(self.max_length))
         model_table.add_row("Batch Size", str(self.batch_size))
+        model_table.add_row("Insert Batch Size", str(self.insert_batch_size))
         
         console.print(model_table)
         console.print()
         
-    def load_chunks(self) -> List[Dict[str, Any]]:
-        """Load chunks from the input JSONL file with progress."""
-        chunks = []
+    def iter_batches(self, batch_size: int) -> Iterator[Tuple[List[str], List[str], List[Dict[str, Any]], List[int]]]:
+        """Stream the input JSONL file as batches of parallel lists.
         
-        console.print(Panel.fit(f"📄 Loading Data: {self.input_file}", style="blue"))
+        Args:
+            batch_size: Number of chunks per yielded batch
+            
+        Yields:
+            Parallel lists of chunk ids, texts, metadatas and input bytes per chunk
+        """
+        if self.arrow_reader:
+            yield from self._iter_arrow_batches(batch_size)
+            return
         
-        with console.status("[bold blue]Reading JSONL file...", spinner="dots12"):
-            with open(self.input_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    if line.strip():
-                        chunk = json.loads(line)
-                        chunks.append(chunk)
+        ids, texts, metadatas, sizes = [], [], [], []
+        with open(self.input_file, 'rb') as f:
+            for chunk, size in iter_jsonl(f):
+                ids.append(chunk['id'])
+                texts.append(chunk['text'])
+                metadatas.append({'source': chunk['source']})
+                sizes.append(size)
+                if len(ids) == batch_size:
+                    yield ids, texts, metadatas, sizes
+                    ids, texts, metadatas, sizes = [], [], [], []
+        if ids:
+            yield ids, texts, metadatas, sizes
+    
+    def _iter_arrow_batches(self, batch_size: int) -> Iterator[Tuple[List[str], List[str], List[Dict[str, Any]], List[int]]]:
+        """Stream the input with pyarrow's JSON reader, re-chunked into batches.
         
-        # Data statistics
+        Record batches are parsed columnar in C++ threads. Input bytes are only known
+        per record batch (from the file position), so they are spread evenly over
+        its records for progress reporting.
+        """
+        ids, texts, metadatas, sizes = [], [], [], []
+        with open(self.input_file, 'rb') as f:
+            reader = paj.open_json(f, read_options=paj.ReadOptions(block_size=ARROW_BLOCK_SIZE))
+            consumed = 0
+            for record_batch in reader:
+                num_rows = record_batch.num_rows
+                if not num_rows:
+                    continue
+                position = f.tell()
+                base, extra = divmod(max(position - consumed, 0), num_rows)
+                consumed = max(position, consumed)
+                
+                ids.extend(record_batch.column('id').to_pylist())
+                texts.extend(record_batch.column('text').to_pylist())
+                metadatas.extend({'source': source} for source in record_batch.column('source').to_pylist())
+                sizes.extend([base] * num_rows)
+                sizes[-1] += extra
+                
+                while len(ids) >= batch_size:
+                    yield ids[:batch_size], texts[:batch_size], metadatas[:batch_size], sizes[:batch_size]
+                    del ids[:batch_size], texts[:batch_size], metadatas[:batch_size], sizes[:batch_size]
+        if ids:
+            yield ids, texts, metadatas, sizes
+    
+    def _print_data_stats(self, total_chunks: int, total_chars: int, max_chars: int):
+        """Print statistics about the input chunks."""
         data_table = Table(title="📊 Data Statistics", show_header=True, header_style="bold blue")
         data_table.add_column("Metric", style="cyan")
         data_table.add_column("Value", style="white")
         
-        data_table.add_row("Total Chunks", str(len(chunks)))
-        if chunks:
-            avg_length = sum(len(chunk.get('text', '')) for chunk in chunks) / len(chunks)
-            data_table.add_row("Average Text Length", f"{avg_length:.0f} characters")
-            max_length = max(len(chunk.get('text', '')) for chunk in chunks)
-            data_table.add_row("Max Text Length", f"{max_length} characters")
+        data_table.add_row("Total Chunks", str(total_chunks))
+        if total_chunks:
+            data_table.add_row("Average Text Length", f"{total_chars / total_chunks:.0f} characters")
+            data_table.add_row("Max Text Length", f"{max_chars} characters")
         
         console.print(data_table)
         console.print()
-        
-        return chunks
     
-    def process_and_store_chunks(self, chunks: List[Dict[str, Any]]) -> None:
-        """Process chunks with enhanced visualization and monitoring."""
-        if not chunks:
-            console.print("❌ No chunks to process!", style="bold red")
-            return
-        
-        chunk_ids = [chunk['id'] for chunk in chunks]
-        texts = [chunk['text'] for chunk in chunks]
-        metadatas = [{'source': chunk['source']} for chunk in chunks]
+    def process_and_store_chunks(self) -> None:
+        """Stream chunks from the input file, embed them and store them in ChromaDB."""
+        file_size = os.path.getsize(self.input_file)
+        window_size = self.batch_size * SORT_WINDOW_BATCHES
+        
+        console.print(Panel.fit(
+            f"⚙️ Processing {self.input_file} ({file_size / (1024**2):.1f} MB) in windows of {window_size} chunks",
+            style="yellow"
+        ))
+        
+        # Encoding and storage run as a pipeline: the GPU encodes batch i+1 while
+        # a consumer thread inserts batch i into ChromaDB. The bounded queue keeps
+        # only a few batches resident instead of the full embedding matrix.
+        batches = queue.Queue(maxsize=STORE_QUEUE_DEPTH)
+        errors = []
+        total_chunks = total_tokens = total_chars = max_chars = 0
+        batch_sizes = []
         
-        total_batches = (len(chunks) + self.batch_size - 1) // self.batch_size
-        total_tokens = 0  # Initialize token counter
-        
-        console.print(Panel.fit(f"⚙️ Processing {len(chunks)} chunks in {total_batches} batches", style="yellow"))
-        
-        # Create layout for live updating
-        layout = Layout()
-        layout.split_column(
-            Layout(name="header", size=3),
-            Layout(name="main", ratio=1),
-            Layout(name="footer", size=8)
-        )
-        
-        # Embedding progress
         with Progress(
             SpinnerColumn(),
             TextColumn("[progress.description]{task.description}"),
             BarColumn(),
             TaskProgressColumn(),
-            MofNCompleteColumn(),
+            DownloadColumn(),
             TimeElapsedColumn(),
             TimeRemainingColumn(),
             console=console,
-            transient=False
+            transient=False,
+            # advance() only records state; rendering happens on the refresh
+            # thread, so a low rate keeps it off the encode loop's cores
+            refresh_per_second=2
         ) as progress:
             
+            # Both stages report progress in bytes of input consumed
             embedding_task = progress.add_task(
                 "[green]🧠 Generating Embeddings",
-                total=len(texts)
+                total=file_size
             )
-            
-            # Custom encode with progress callback
-            batch_embeddings = []
-            processed_count = 0
-            
-            for i in range(0, len(texts), self.batch_size):
-                batch_texts = texts[i:i+self.batch_size]
-                
-                # Tokenize to get token count for this batch
-                encoding = self.model.tokenizer(batch_texts, padding=False, truncation=False)
-                batch_tokens = sum(len(e) for e in encoding['input_ids'])
-                total_tokens += batch_tokens
-                
-                # Generate embeddings for this batch
-                batch_result = self.model.encode(
-                    batch_texts,
-                    task=self.task,
-                    prompt_name=self.task,
-                    truncate_dim=self.truncate_dim,
-                    max_length=self.max_length,
-                    show_progress_bar=False
-                )
-                
-                batch_embeddings.extend(batch_result)
-                processed_count += len(batch_texts)
-                progress.update(embedding_task, completed=processed_count)
-        
-        console.print("✅ Embedding generation complete!")
-        console.print()
-        
-        # ChromaDB storage progress
-        with Progress(
-            SpinnerColumn(),
-            TextColumn("[progress.description]{task.description}"),
-            BarColumn(),
-            TaskProgressColumn(),
-            MofNCompleteColumn(),
-            TimeElapsedColumn(),
-            console=console,
-            transient=False
-        ) as progress:
-            
             storage_task = progress.add_task(
                 "[blue]💾 Storing in ChromaDB",
-                total=total_batches
+                total=file_size
             )
             
-            for i in range(0, len(chunks), self.batch_size):
-                batch_ids = chunk_ids[i:i+self.batch_size]
-                batch_emb = batch_embeddings[i:i+self.batch_size]
-                batch_docs = texts[i:i+self.batch_size]
-                batch_meta = metadatas[i:i+self.batch_size]
-                
-                # Convert numpy to list if needed
-                if hasattr(batch_emb, 'tolist'):
-                    batch_emb = [emb.tolist() if hasattr(emb, 'tolist') else emb for emb in batch_emb]
-                
-                self.collection.add(
-                    ids=batch_ids,
-                    embeddings=batch_emb,
-                    documents=batch_docs,
-                    metadatas=batch_meta
-                )
-                
-                progress.advance(storage_task)
+            writer = threading.Thread(
+                target=self._store_batches,
+                args=(batches, progress, storage_task, errors),
+                daemon=True
+            )
+            writer.start()
+            
+            try:
+                for chunk_ids, texts, metadatas, sizes in self.iter_batches(window_size):
+                    if errors:
+                        break
+                    
+                    # Tokenize each window once: the token counts drive both the
+                    # statistics and the encode order. Encoding longest-first keeps
+                    # texts of similar length in the same batch, so little compute is
+                    # wasted on padding tokens.
+                    lengths = self._token_lengths(texts)
+                    order = np.argsort(-lengths, kind='stable')
+                    
+                    total_chunks += len(texts)
+                    total_tokens += int(lengths.sum())
+                    text_lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+                    total_chars += int(text_lengths.sum())
+                    max_chars = max(max_chars, int(text_lengths.max()))
+                    
+                    for batch_idx in self._pack_batches(order, lengths):
+                        if errors:
+                            break
+                        batch_texts = [texts[j] for j in batch_idx]
+                        batch_bytes = sum(sizes[j] for j in batch_idx)
+                        
+                        # Generate embeddings for this batch
+                        batch_result = self._encode(batch_texts)
+                        
+                        # Chroma does not care about insert order, so the batch is stored
+                        # in encode order together with its own ids and metadata
+                        batches.put((
+                            [chunk_ids[j] for j in batch_idx],
+                            batch_result,
+                            batch_texts,
+                            [metadatas[j] for j in batch_idx],
+                            batch_bytes
+                        ))
+                        progress.advance(embedding_task, batch_bytes)
+                        batch_sizes.append(len(batch_idx))
+            finally:
+                batches.put(None)
+                writer.join()
+            
+            if not errors:
+                # Trailing blank lines are not attributed to any chunk
+                progress.update(embedding_task, completed=file_size)
+                progress.update(storage_task, completed=file_size)
+        
+        if errors:
+            raise errors[0]
         
+        if not total_chunks:
+            console.print("❌ No chunks found in the input file. Nothing to process.", style="bold red")
+            return
+        
+        console.print("✅ Embedding generation complete!")
         console.print("✅ Storage complete!")
         console.print()
         
+        self._print_data_stats(total_chunks, total_chars, max_chars)
+        
         # Final statistics
-        self._print_completion_stats(len(chunks), total_tokens)
+        self._print_completion_stats(total_chunks, total_tokens, batch_sizes)
+    
+    def _token_lengths(self, texts: List[str]) -> np.ndarray:
+        """Token count of each text as the encoder sees it, task prompt included.
+        
+        Mirrors model.tokenize: the prompt is prepended, the result is stripped and
+        truncated at max_length (which equals the model's max_seq_length), so batches
+        get the same padded length here as in the forward pass.
+        """
+        prompt = self.model.prompts.get(self.task) or ''
+        texts = [(prompt + text).strip() for text in texts]
+        encoding = self.model.tokenizer(
+            texts, padding=False, truncation=True, max_length=self.max_length,
+            return_length=True, return_attention_mask=False
+        )
+        return np.asarray(encoding['length'], dtype=np.int64)
+    
+    def _pack_batches(self, order: np.ndarray, lengths: np.ndarray) -> Iterator[np.ndarray]:
+        """Split length-sorted (longest first) chunk indices into encode batches.
+        
+        With a token budget, a batch grows until its padded size (chunks x longest
+        chunk) would exceed max_tokens_per_batch, so short texts get large batches
+        and long texts small ones.
+        """
+        if not self.max_tokens_per_batch:
+            for i in range(0, len(order), self.batch_size):
+                yield order[i:i+self.batch_size]
+            return
+        
+        start = 0
+        while start < len(order):
+            # The first chunk is the longest, so it sets the padded length
+            longest = max(int(lengths[order[start]]), 1)
+            if self.cuda_graphs:
+                count = self._bucket_rows(self._seq_bucket(longest))
+            else:
+                count = max(1, self.max_tokens_per_batch // longest)
+            yield order[start:start+count]
+            start += count
+    
+    def _seq_buckets(self) -> List[int]:
+        """Padded sequence lengths used for CUDA graph buckets."""
+        buckets = []
+        seq_len = SEQ_BUCKET_MIN
+        while seq_len < self.max_length:
+            buckets.append(seq_len)
+            seq_len *= 2
+        buckets.append(self.max_length)
+        return buckets
     
-    def _print_completion_stats(self, total_chunks: int, total_tokens: int):
+    def _seq_bucket(self, length: int) -> int:
+        """Smallest bucket holding a sequence of the given length."""
+        for seq_len in self._seq_buckets():
+            if length <= seq_len:
+                return seq_len
+        return length
+    
+    def _bucket_rows(self, seq_len: int) -> int:
+        """Rows per batch for a sequence-length bucket."""
+        if self.max_tokens_per_batch:
+            return max(1, self.max_tokens_per_batch // seq_len)
+        return self.batch_size
+    
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        """Encode one batch of texts into L2-normalized embeddings."""
+        if self.pinned_memory or self.cuda_graphs:
+            return self._encode_forward(texts)
+        return self.model.encode(
+            texts,
+            batch_size=len(texts),
+            task=self.task,
+            prompt_name=self.task,
+            truncate_dim=self.truncate_dim,
+            max_length=self.max_length,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+    
+    def _insert_groups(self, batches: queue.Queue, errors: list) -> Iterator[tuple]:
+        """Group encoded batches from the queue into inserts of ``insert_batch_size`` items.
+        
+        Each collection.add is a SQLite transaction plus an HNSW update, so encoded
+        batches are buffered and flushed in larger groups. Yields until the None
+        sentinel arrives, and only drains the queue once an error was recorded.
+        """
+        ids, embs, docs, metas = [], [], [], []
+        pending_bytes = 0
+        
+        while True:
+            item = batches.get()
+            if item is None:
+                break
+            if errors:
+                # Keep draining so the producer never blocks on a full queue
+                continue
+            
+            batch_ids, batch_emb, batch_docs, batch_meta, batch_bytes = item
+            ids.extend(batch_ids)
+            embs.append(batch_emb)
+            docs.extend(batch_docs)
+            metas.extend(batch_meta)
+            pending_bytes += batch_bytes
+            if len(ids) >= self.insert_batch_size:
+                yield ids, np.concatenate(embs), docs, metas, pending_bytes
+                ids, embs, docs, metas = [], [], [], []
+                pending_bytes = 0
+        
+        if ids and not errors:
+            yield ids, np.concatenate(embs), docs, metas, pending_bytes
+    
+    def _encode_forward(self, texts: List[str], seq_len: Optional[int] = None) -> np.ndarray:
+        """Encode one batch like SentenceTransformer.encode, with control over the inputs.
+        
+        With pinned_memory, the token tensors are copied into page-locked host buffers
+        that are reused across batches, so the transfer to the GPU is an async DMA
+        rather than a synchronous copy from pageable memory. With cuda_graphs, the
+        batch is padded to its (rows, sequence length) bucket so every forward hits
+        an already captured graph; padding is fully masked and sliced off.
+        
+        Args:
+            texts: Texts to encode
+            seq_len: Sequence length to pad to (e.g., for warmup); picked from the
+                buckets if None
+        """
+        prompt = self.model.prompts.get(self.task)
+        prompted = [prompt + text for text in texts] if prompt else texts
+        features = self.model.tokenize(prompted)
+        
+        if self.cuda_graphs:
+            rows, length = features['input_ids'].shape
+            seq_len = seq_len or self._seq_bucket(length)
+            # Only (bucket rows, seq_len) shapes were captured. The packer measures
+            # lengths like model.tokenize, so batches fit; split any that do not
+            # rather than running an uncaptured shape.
+            target_rows = self._bucket_rows(seq_len)
+            if rows > target_rows:
+                return np.concatenate([
+                    self._encode_forward(texts[i:i+target_rows])
+                    for i in range(0, len(texts), target_rows)
+                ])
+            pad_id = self.model.tokenizer.pad_token_id or 0
+            for key, tensor in features.items():
+                if isinstance(tensor, torch.Tensor) and tensor.dim() == 2:
+                    padded = tensor.new_full((target_rows, seq_len), pad_id if key == 'input_ids' else 0)
+                    padded[:rows, :length] = tensor
+                    features[key] = padded
+        
+        device_features = {}
+        for key, tensor in features.items():
+            if not isinstance(tensor, torch.Tensor):
+                device_features[key] = tensor
+                continue
+            if not self.pinned_memory:
+                device_features[key] = tensor.to(self.device)
+                continue
+            buffer = self._pinned_buffers.get(key)
+            if buffer is None or buffer.numel() < tensor.numel() or buffer.dtype != tensor.dtype:
+                size = max(tensor.numel(), self.max_tokens_per_batch or 0)
+                buffer = torch.empty(size, dtype=tensor.dtype, pin_memory=True)
+                self._pinned_buffers[key] = buffer
+            staged = buffer[:tensor.numel()].view(tensor.shape)
+            staged.copy_(tensor)
+            device_features[key] = staged.to(self.device, non_blocking=True)
+        
+        with torch.inference_mode():
+            # The task kwarg selects the model's task adapter, as in encode(task=...)
+            embeddings = self.model.forward(device_features, task=self.task)['sentence_embedding']
+            embeddings = embeddings[:len(texts)]
+            if self.truncate_dim:
+                embeddings = embeddings[:, :self.truncate_dim]
+            embeddings = torch.nn.functional.normalize(embeddings.float(), p=2, dim=1)
+        # The copy back synchronizes, so the staging buffers are free for the next batch
+        return embeddings.cpu().numpy()
+    
+    def _store_batches(self, batches: queue.Queue, progress: Progress, storage_task, errors: list) -> None:
+        """Insert encoded batches into ChromaDB until the None sentinel arrives."""
+        groups = self._insert_groups(batches, errors)
+        
+        if self.chroma_host:
+            try:
+                asyncio.run(self._store_batches_async(groups, progress, storage_task, errors))
+            except Exception as e:
+                errors.append(e)
+            for _ in groups:
+                pass
+            return
+        
+        # Chroma (>=0.5) accepts a 2D ndarray directly; going through Python
+        # lists would allocate one float object per dimension
+        for ids, embeddings, docs, metas, nbytes in groups:
+            try:
+                self.collection.add(
+                    ids=ids,
+                    embeddings=embeddings,
+                    documents=docs,
+                    metadatas=metas
+                )
+            except Exception as e:
+                errors.append(e)
+                continue
+            progress.advance(storage_task, nbytes)
+    
+    async def _store_batches_async(self, groups: Iterator[tuple], progress: Progress, storage_task, errors: list) -> None:
+        """Pipeline inserts to a Chroma server, keeping several requests in flight."""
+        client = await chromadb.AsyncHttpClient(host=self.chroma_host, port=self.chroma_port)
+        collection = await client.get_collection(name=self.collection_name)
+        loop = asyncio.get_running_loop()
+        in_flight = set()
+        
+        async def add(ids, embeddings, docs, metas, nbytes):
+            try:
+                await collection.add(
+                    ids=ids,
+                    embeddings=embeddings,
+                    documents=docs,
+                    metadatas=metas
+                )
+            except Exception as e:
+                errors.append(e)
+                return
+            progress.advance(storage_task, nbytes)
+        
+        while True:
+            # The queue read blocks, so it runs off the event loop
+            group = await loop.run_in_executor(None, next, groups, None)
+            if group is None:
+                break
+            task = asyncio.create_task(add(*group))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+            if len(in_flight) >= ASYNC_INSERTS_IN_FLIGHT:
+                await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+        
+        if in_flight:
+            await asyncio.gather(*in_flight)
+    
+    def _print_completion_stats(self, total_chunks: int, total_tokens: int, batch_sizes: List[int]):
         """Print completion statistics and system status."""
         total_time = time.time() - self.start_time
         
@@ -421,10 +880,18 @@ class ChunkVectorizer:
         
         stats_table.add_row("Total Chunks Processed", str(total_chunks))
         stats_table.add_row("Total Tokens Processed", f"{total_tokens:,}")
+        stats_table.add_row("Encode Batches", str(len(batch_sizes)))
+        stats_table.add_row(
+            "Batch Size (Avg / Max)",
+            f"{sum(batch_sizes) / len(batch_sizes):.1f} / {max(batch_sizes)}" if batch_sizes else "N/A"
+        )
         stats_table.add_row("Total Time", f"{total_time:.2f} seconds")
         stats_table.add_row("Processing Speed (Chunks)", f"{total_chunks/total_time:.2f} chunks/sec")
         stats_table.add_row("Processing Speed (Tokens)", f"{total_tokens / total_time:,.0f} tokens/sec")
-        stats_table.add_row("Database Location", os.path.abspath(self.db_directory))
+        stats_table.add_row(
+            "Database Location",
+            f"http://{self.chroma_host}:{self.chroma_port}" if self.chroma_host else os.path.abspath(self.db_directory)
+        )
         stats_table.add_row("Collection Name", self.collection_name)
         stats_table.add_row("Documents in Collection", str(self.collection.count()))
         
@@ -444,11 +911,8 @@ class ChunkVectorizer:
     def run(self) -> None:
         """Run the full vectorization process with enhanced visualization."""
         try:
-            chunks = self.load_chunks()
-            if chunks:
-                self.process_and_store_chunks(chunks)
-            else:
-                console.print("❌ No chunks found in the input file. Nothing to process.", style="bold red")
+            console.print(Panel.fit(f"📄 Streaming Data: {self.input_file}", style="blue"))
+            self.process_and_store_chunks()
         except Exception as e:
             console.print(f"❌ Error during processing: {str(e)}", style="bold red")
             raise
@@ -477,6 +941,37 @@ if __name__ == "__main__":
                         help="Batch size for embedding generation")
     parser.add_argument("--device", "-dev", type=str, default=None,
                         help="Device to use for computation, e.g., 'cuda', 'cpu'. Auto-detects if None.")
+    parser.add_argument("--dtype", type=str, default=None, choices=['float32', 'float16', 'bfloat16'],
+                        help="Inference dtype. Auto-selects if None: bfloat16/float16 on CUDA, float32 on CPU.")
+    parser.add_argument("--backend", type=str, default="torch", choices=['torch', 'onnx', 'openvino'],
+                        help="Inference backend. onnx/openvino require `pip install optimum[onnxruntime]` / `optimum[openvino]`.")
+    parser.add_argument("--model-file", type=str, default=None,
+                        help="Exported model file for the onnx/openvino backends, e.g. 'onnx/model_O4.onnx' "
+                             "(pre-export with `optimum-cli export onnx --optimize O4`).")
+    parser.add_argument("--compile", action="store_true",
+                        help="torch.compile the transformer forward (torch backend, PyTorch 2.1+). Adds a warmup compile.")
+    parser.add_argument("--insert-batch-size", type=int, default=250,
+                        help="Number of embeddings per ChromaDB insert (independent of the encode batch size)")
+    parser.add_argument("--chroma-host", type=str, default=None,
+                        help="Host of a running Chroma server (`chroma run --path <db>`). Writes go over "
+                             "AsyncHttpClient instead of a local PersistentClient; --db is then ignored.")
+    parser.add_argument("--chroma-port", type=int, default=8000,
+                        help="Port of the Chroma server")
+    parser.add_argument("--max-tokens-per-batch", type=int, default=0,
+                        help="Padded token budget per encode batch, task prompt included (length-sorted "
+                             "packing, e.g. 32768). When set it takes precedence over --batch-size, which "
+                             "then only sizes the length-sort window. 0 keeps the fixed --batch-size.")
+    parser.add_argument("--pinned-memory", action="store_true",
+                        help="Stage token tensors in reused pinned host buffers for async GPU copies "
+                             "(bypasses SentenceTransformer.encode; CUDA with the torch backend only)")
+    parser.add_argument("--cuda-graphs", action="store_true",
+                        help="Pad batches to fixed sequence-length buckets and capture one CUDA graph per bucket "
+                             "at startup (implies --compile; CUDA with the torch backend only)")
+    parser.add_argument("--int8", action="store_true",
+                        help="Dynamic INT8 quantization of Linear layers for CPU inference (torch backend, float32). "
+                             "For ONNX, quantize the export with `optimum-cli onnxruntime quantize --avx512_vnni` instead.")
+    parser.add_argument("--arrow-reader", action="store_true",
+                        help="Parse the input JSONL with pyarrow's multi-threaded streaming reader (requires pyarrow>=18)")
     
     args = parser.parse_args()
     
@@ -488,6 +983,18 @@ if __name__ == "__main__":
         truncate_dim=args.truncate_dim,
         max_length=args.max_length,
         device=args.device,
-        batch_size=args.batch_size
+        batch_size=args.batch_size,
+        dtype=args.dtype,
+        backend=args.backend,
+        model_file=args.model_file,
+        compile=args.compile,
+        insert_batch_size=args.insert_batch_size,
+        chroma_host=args.chroma_host,
+        chroma_port=args.chroma_port,
+        max_tokens_per_batch=args.max_tokens_per_batch or None,
+        pinned_memory=args.pinned_memory,
+        cuda_graphs=args.cuda_graphs,
+        int8=args.int8,
+        arrow_reader=args.arrow_reader
     )
     vectorizer.run()
\ No newline at end of file
@@ -2,13 +2,37 @@
 
 import os
 import argparse
+import gc
+import hashlib
+import itertools
 import numpy as np
 import plotly.graph_objects as go
 import chromadb
 from umap import UMAP
 import webbrowser
 import random
-from sklearn.cluster import KMeans
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import PCA
+try:
+    import faiss
+except ImportError:
+    faiss = None
+try:
+    from openTSNE import TSNE
+except ImportError:
+    TSNE = None
+try:
+    from pacmap import PaCMAP
+except ImportError:
+    PaCMAP = None
+
+# Axis label for each dimensionality reduction backend
+REDUCER_LABELS = {'umap': 'UMAP', 'tsne': 't-SNE', 'pacmap': 'PaCMAP', 'pca': 'PCA'}
+
+# Rows fetched per ChromaDB get() call
+GET_BATCH_SIZE = 10_000
+# Directory for cached 2D/3D layouts and cluster assignments
+CACHE_DIR = "artifacts/cache/visualizer"
 
 
 class EmbeddingVisualizer:
@@ -21,7 +45,10 @@ class EmbeddingVisualizer:
         max_points: int = 2000,
         random_seed: int = 42,
         n_clusters: int = 10,
-        outlier_threshold: float = 3.0
+        outlier_threshold: float = 3.0,
+        deterministic: bool = False,
+        offline: bool = False,
+        reducer: str = 'umap'
     ):
         """Initialize the visualizer with database path and visualization parameters.
 
@@ -33,16 +60,24 @@ class EmbeddingVisualizer:
             random_seed: Random seed for reproducibility
             n_clusters: Number of clusters to create for coloring points
             outlier_threshold: Z-score threshold for outlier removal (higher = more outliers kept)
+            deterministic: Seed UMAP for reproducible layouts. This makes UMAP single-threaded;
+                otherwise its nearest-neighbor descent and layout run on all cores
+            offline: Reference a shared plotly.min.js next to the HTML instead of the CDN
+            reducer: Dimensionality reduction backend ('umap', 'tsne', 'pacmap' or 'pca')
         """
         self.db_directory = db_directory
         self.collection_name = collection_name
         # Update output directory to artifacts/visualizations
         visualization_dir = "artifacts/visualizations"
-        self.output_file = f"{visualization_dir}/visualization_{collection_name}_{random_seed}_{max_points}_{n_clusters}_{outlier_threshold}.html"
+        reducer_suffix = "" if reducer == 'umap' else f"_{reducer}"
+        self.output_file = f"{visualization_dir}/visualization_{collection_name}_{random_seed}_{max_points}_{n_clusters}_{outlier_threshold}{reducer_suffix}.html"
         self.max_points = max_points
         self.random_seed = random_seed
         self.n_clusters = n_clusters
         self.outlier_threshold = outlier_threshold
+        self.deterministic = deterministic
+        self.offline = offline
+        self.reducer = reducer
 
         # Set random seed for reproducibility
         random.seed(self.random_seed)
@@ -63,50 +98,99 @@ class EmbeddingVisualizer:
     def get_embeddings(self):
         """Retrieve embeddings and metadata from ChromaDB."""
         print("Retrieving embeddings from ChromaDB...")
-        
-        # Get all embeddings
-        result = self.collection.get(
-            include=['embeddings', 'documents', 'metadatas']
-        )
 
-        embeddings = np.array(result['embeddings'])
-        documents = result['documents']
-        metadatas = result['metadatas']
-        ids = result['ids']
+        total = self.collection.count()
+
+        # If there are too many embeddings, sample a subset. Only the ids are paged
+        # through to find the sampled rows, so at most max_points vectors are loaded.
+        if total > self.max_points:
+            print(f"Sampling {self.max_points} out of {total} points for visualization")
+            # Generator.choice draws distinct indices in O(max_points) rather than
+            # permuting all N; the indices are sorted anyway, so skip the shuffle
+            rng = np.random.default_rng(self.random_seed)
+            indices = np.sort(rng.choice(total, size=self.max_points, replace=False, shuffle=False))
+            sample_ids = []
+            for offset in range(0, total, GET_BATCH_SIZE):
+                lo, hi = np.searchsorted(indices, [offset, offset + GET_BATCH_SIZE])
+                if lo == hi:
+                    continue
+                page_ids = self.collection.get(limit=GET_BATCH_SIZE, offset=offset, include=[])['ids']
+                sample_ids.extend(page_ids[i - offset] for i in indices[lo:hi] if i - offset < len(page_ids))
+            pages = (
+                self.collection.get(ids=sample_ids[i:i + GET_BATCH_SIZE], include=['embeddings', 'documents', 'metadatas'])
+                for i in range(0, len(sample_ids), GET_BATCH_SIZE)
+            )
+        else:
+            pages = (
+                self.collection.get(limit=GET_BATCH_SIZE, offset=offset, include=['embeddings', 'documents', 'metadatas'])
+                for offset in range(0, total, GET_BATCH_SIZE)
+            )
+
+        embedding_pages, documents, metadatas, ids = [], [], [], []
+        for result in pages:
+            # float32 halves the bytes moved through UMAP's and KMeans' distance loops
+            embedding_pages.append(np.asarray(result['embeddings'], dtype=np.float32))
+            documents.extend(result['documents'])
+            metadatas.extend(result['metadatas'])
+            ids.extend(result['ids'])
+        embeddings = np.concatenate(embedding_pages)
 
         print(f"Retrieved {len(embeddings)} embeddings with {embeddings.shape[1]} dimensions")
 
-        # If there are too many embeddings, sample a subset
-        if len(embeddings) > self.max_points:
-            print(f"Sampling {self.max_points} out of {len(embeddings)} points for visualization")
-            indices = np.random.choice(len(embeddings), self.max_points, replace=False)
-            embeddings = embeddings[indices]
-            documents = [documents[i] for i in indices]
-            metadatas = [metadatas[i] for i in indices]
-            ids = [ids[i] for i in indices]
-
         return embeddings, documents, metadatas, ids
 
     def reduce_dimensions(self, embeddings):
-        """Reduce embedding dimensions to 2D and 3D using UMAP."""
-        print("Reducing dimensions using UMAP...")
-
-        # Reduce to 3D
-        reducer_3d = UMAP(n_components=3, random_state=self.random_seed, n_neighbors=15, min_dist=0.1)
-        embeddings_3d = reducer_3d.fit_transform(embeddings)
+        """Reduce embedding dimensions to 3D with the selected backend, and to 2D by projecting the 3D layout."""
+        label = REDUCER_LABELS[self.reducer]
+        print(f"Reducing dimensions using {label}...")
+
+        # Reduce to 3D. The neighbor graph and layout optimization dominate the cost,
+        # so the reduction is fitted only once.
+        if self.reducer == 'umap':
+            if self.deterministic:
+                reducer_3d = UMAP(n_components=3, random_state=self.random_seed, n_neighbors=15, min_dist=0.1,
+                                  low_memory=False)
+            else:
+                reducer_3d = UMAP(n_components=3, n_neighbors=15, min_dist=0.1, low_memory=False, n_jobs=-1)
+            embeddings_3d = reducer_3d.fit_transform(embeddings)
+            # Release the fitted model's kNN graph and fuzzy simplicial set
+            del reducer_3d
+        elif self.reducer == 'tsne':
+            if TSNE is None:
+                raise ImportError("openTSNE is required for --reducer tsne (pip install openTSNE)")
+            # openTSNE's FFT gradients only support 2 components; Barnes-Hut handles 3
+            embeddings_3d = np.asarray(TSNE(
+                n_components=3, negative_gradient_method="bh", n_jobs=-1, random_state=self.random_seed
+            ).fit(embeddings))
+        elif self.reducer == 'pacmap':
+            if PaCMAP is None:
+                raise ImportError("pacmap is required for --reducer pacmap (pip install pacmap)")
+            embeddings_3d = PaCMAP(
+                n_components=3, n_neighbors=10, MN_ratio=0.5, FP_ratio=2.0, random_state=self.random_seed
+            ).fit_transform(embeddings)
+        else:
+            # Linear and cheapest; no neighbor graph or JIT warmup
+            embeddings_3d = PCA(n_components=3, random_state=self.random_seed).fit_transform(embeddings)
         print(f"Reduced dimensions from {embeddings.shape[1]} to 3")
 
-        # Reduce to 2D
-        reducer_2d = UMAP(n_components=2, random_state=self.random_seed, n_neighbors=15, min_dist=0.1)
-        embeddings_2d = reducer_2d.fit_transform(embeddings)
-        print(f"Reduced dimensions from {embeddings.shape[1]} to 2")
+        # Derive the 2D view from the top two principal axes of the 3D layout
+        embeddings_2d = PCA(n_components=2, random_state=self.random_seed).fit_transform(embeddings_3d)
+        print("Projected 3D layout to 2D with PCA")
 
         return embeddings_2d, embeddings_3d
 
     def cluster_embeddings(self, embeddings):
         """Cluster embeddings for coloring in visualization."""
         print(f"Clustering embeddings into {self.n_clusters} groups...")
-        kmeans = KMeans(n_clusters=self.n_clusters, random_state=self.random_seed)
+        # Colors only need stable assignments, not an optimal clustering
+        if faiss is not None:
+            data = np.ascontiguousarray(embeddings, dtype=np.float32)
+            kmeans = faiss.Kmeans(data.shape[1], self.n_clusters, niter=20, seed=self.random_seed)
+            kmeans.train(data)
+            _, labels = kmeans.index.search(data, 1)
+            return labels.ravel()
+
+        kmeans = MiniBatchKMeans(n_clusters=self.n_clusters, random_state=self.random_seed, batch_size=256, n_init=3)
         clusters = kmeans.fit_predict(embeddings)
         return clusters
 
@@ -118,32 +202,21 @@ class EmbeddingVisualizer:
         """
         print(f"Filtering outliers with threshold {self.outlier_threshold}...")
 
-        # Calculate z-scores for 3D embeddings along each axis
-        z_scores_3d = np.zeros_like(embeddings_3d)
-        for dim in range(3):
-            mean = np.mean(embeddings_3d[:, dim])
-            std = np.std(embeddings_3d[:, dim])
-            if std > 0:  # Avoid division by zero
-                z_scores_3d[:, dim] = np.abs((embeddings_3d[:, dim] - mean) / std)
-
-        # A point is an outlier if its z-score exceeds the threshold in any dimension
-        max_z_scores_3d = np.max(z_scores_3d, axis=1)
-        outliers_3d = max_z_scores_3d > self.outlier_threshold
-
-        # Calculate z-scores for 2D embeddings along each axis
-        z_scores_2d = np.zeros_like(embeddings_2d)
-        for dim in range(2):
-            mean = np.mean(embeddings_2d[:, dim])
-            std = np.std(embeddings_2d[:, dim])
-            if std > 0:  # Avoid division by zero
-                z_scores_2d[:, dim] = np.abs((embeddings_2d[:, dim] - mean) / std)
-
-        # A point is an outlier if its z-score exceeds the threshold in any dimension
-        max_z_scores_2d = np.max(z_scores_2d, axis=1)
-        outliers_2d = max_z_scores_2d > self.outlier_threshold
-
-        # Combine both outlier detection methods (a point is kept only if it's not an outlier in either 2D or 3D)
-        outliers = outliers_2d | outliers_3d
+        # By Samuelson's inequality no z-score (population std) can exceed sqrt(n - 1),
+        # so a threshold at or above it cannot filter anything
+        if self.outlier_threshold >= np.sqrt(max(len(embeddings_3d) - 1, 0)):
+            print("Filtered out 0 outliers (threshold exceeds the maximum possible z-score)")
+            return embeddings_2d, embeddings_3d, documents, metadatas, ids, clusters
+
+        # A point is an outlier if its z-score exceeds the threshold in any dimension of
+        # either view (a point is kept only if it's not an outlier in either 2D or 3D).
+        # Z-scores are per axis, so both views are scored in one pass over [2D | 3D].
+        # Constant axes get an infinite std so their z-scores are 0.
+        combined = np.hstack([embeddings_2d, embeddings_3d])
+        std = combined.std(axis=0)
+        std[std == 0] = np.inf
+        z_scores = np.abs((combined - combined.mean(axis=0)) / std)
+        outliers = np.any(z_scores > self.outlier_threshold, axis=1)
 
         # Count outliers
         num_outliers = np.sum(outliers)
@@ -153,9 +226,11 @@ class EmbeddingVisualizer:
         keep_indices = ~outliers
         embeddings_2d_filtered = embeddings_2d[keep_indices]
         embeddings_3d_filtered = embeddings_3d[keep_indices]
-        documents_filtered = [doc for i, doc in enumerate(documents) if keep_indices[i]]
-        metadatas_filtered = [meta for i, meta in enumerate(metadatas) if keep_indices[i]]
-        ids_filtered = [id for i, id in enumerate(ids) if keep_indices[i]]
+        # Convert the mask once so the list filters don't box a numpy bool per element
+        keep_mask = keep_indices.tolist()
+        documents_filtered = list(itertools.compress(documents, keep_mask))
+        metadatas_filtered = list(itertools.compress(metadatas, keep_mask))
+        ids_filtered = list(itertools.compress(ids, keep_mask))
         clusters_filtered = clusters[keep_indices]
 
         return embeddings_2d_filtered, embeddings_3d_filtered, documents_filtered, metadatas_filtered, ids_filtered, clusters_filtered
@@ -163,6 +238,7 @@ class EmbeddingVisualizer:
     def create_visualization(self, embeddings_2d, embeddings_3d, documents, metadatas, ids, clusters, original_dims):
         """Create an interactive visualization with 2D/3D toggle using Plotly."""
         print("Creating visualization with 2D/3D toggle...")
+        label = REDUCER_LABELS[self.reducer]
 
         # Create a color palette
         colors = [
@@ -171,72 +247,68 @@ class EmbeddingVisualizer:
             '#aec7e8', '#ffbb78', '#98df8a', '#ff9896', '#c5b0d5'
         ]
 
-        # Create hover texts
-        hover_texts = []
-        for i in range(len(documents)):
-            # Extract filename from source path
-            source_path = metadatas[i]['source']
-            filename = os.path.basename(source_path)
-
-            # Truncate document text for hover
-            doc_preview = documents[i][:200] + "..." if len(documents[i]) > 200 else documents[i]
-            doc_preview = doc_preview.replace("\n", "<br>")
+        # Create hover texts: filename from the source path and a truncated preview
+        sources = [meta['source'] for meta in metadatas]
+        basenames = {source: os.path.basename(source) for source in set(sources)}
+        filenames = [basenames[source] for source in sources]
+        previews = [
+            (doc[:200] + "..." if len(doc) > 200 else doc).replace("\n", "<br>")
+            for doc in documents
+        ]
+        hover_texts = [
+            "<b>ID:</b> " + doc_id + "<br><b>File:</b> " + filename + "<br><b>Preview:</b><br>" + preview
+            for doc_id, filename, preview in zip(ids, filenames, previews)
+        ]
 
-            hover_text = f"<b>ID:</b> {ids[i]}<br><b>File:</b> {filename}<br><b>Preview:</b><br>{doc_preview}"
-            hover_texts.append(hover_text)
+        # One trace per view with per-point colors, so the hover texts and
+        # coordinates are serialized once instead of per cluster
+        point_colors = np.array(colors, dtype=object)[np.asarray(clusters) % len(colors)].tolist()
 
-        # Create the figure with subplots
         fig = go.Figure()
 
-        # Add 3D traces (initially visible)
-        for cluster_id in range(self.n_clusters):
-            cluster_indices = np.where(clusters == cluster_id)[0]
-
-            fig.add_trace(go.Scatter3d(
-                x=embeddings_3d[cluster_indices, 0],
-                y=embeddings_3d[cluster_indices, 1],
-                z=embeddings_3d[cluster_indices, 2],
-                mode='markers',
-                marker=dict(
-                    size=5,
-                    color=colors[cluster_id % len(colors)],
-                    opacity=0.7,
-                ),
-                text=[hover_texts[i] for i in cluster_indices],
-                hoverinfo='text',
-                name=f'Cluster {cluster_id}',
-                scene='scene',
-                visible=True
-            ))
-
-        # Add 2D traces (initially hidden)
-        for cluster_id in range(self.n_clusters):
-            cluster_indices = np.where(clusters == cluster_id)[0]
-
-            fig.add_trace(go.Scatter(
-                x=embeddings_2d[cluster_indices, 0],
-                y=embeddings_2d[cluster_indices, 1],
-                mode='markers',
-                marker=dict(
-                    size=8,
-                    color=colors[cluster_id % len(colors)],
-                    opacity=0.7,
-                ),
-                text=[hover_texts[i] for i in cluster_indices],
-                hoverinfo='text',
-                name=f'Cluster {cluster_id}',
-                visible=False
-            ))
+        # Add 3D trace (initially visible)
+        fig.add_trace(go.Scatter3d(
+            x=embeddings_3d[:, 0],
+            y=embeddings_3d[:, 1],
+            z=embeddings_3d[:, 2],
+            mode='markers',
+            marker=dict(
+                size=5,
+                color=point_colors,
+                opacity=0.7,
+            ),
+            text=hover_texts,
+            hoverinfo='text',
+            name='3D',
+            scene='scene',
+            visible=True
+        ))
+
+        # Add 2D trace (initially hidden)
+        fig.add_trace(go.Scatter(
+            x=embeddings_2d[:, 0],
+            y=embeddings_2d[:, 1],
+            mode='markers',
+            marker=dict(
+                size=8,
+                color=point_colors,
+                opacity=0.7,
+            ),
+            text=hover_texts,
+            hoverinfo='text',
+            name='2D',
+            visible=False
+        ))
 
         # Create buttons for 2D/3D toggle
         button_3d = dict(
             label="3D View",
             method="update",
             args=[
-                {"visible": [True] * self.n_clusters + [False] * self.n_clusters},
-                {"scene": {"xaxis": {"title": "UMAP Dimension 1"},
-                           "yaxis": {"title": "UMAP Dimension 2"},
-                           "zaxis": {"title": "UMAP Dimension 3"}},
+                {"visible": [True, False]},
+                {"scene": {"xaxis": {"title": f"{label} Dimension 1"},
+                           "yaxis": {"title": f"{label} Dimension 2"},
+                           "zaxis": {"title": f"{label} Dimension 3"}},
                  "xaxis": {"title": ""},
                  "yaxis": {"title": ""},
                  "title": {"text": f"3D Visualization of {self.collection_name} Embeddings (Original Dimensions: {original_dims})",
@@ -252,9 +324,9 @@ class EmbeddingVisualizer:
             label="2D View",
             method="update",
             args=[
-                {"visible": [False] * self.n_clusters + [True] * self.n_clusters},
-                {"xaxis": {"title": "UMAP Dimension 1"},
-                 "yaxis": {"title": "UMAP Dimension 2"},
+                {"visible": [False, True]},
+                {"xaxis": {"title": f"{label} Dimension 1"},
+                 "yaxis": {"title": f"{label} Dimension 2"},
                  "scene": {"xaxis": {"title": ""},
                            "yaxis": {"title": ""},
                            "zaxis": {"title": ""}},
@@ -290,22 +362,14 @@ class EmbeddingVisualizer:
                 font=dict(size=24)
             ),
             scene=dict(
-                xaxis_title='UMAP Dimension 1',
-                yaxis_title='UMAP Dimension 2',
-                zaxis_title='UMAP Dimension 3'
+                xaxis_title=f'{label} Dimension 1',
+                yaxis_title=f'{label} Dimension 2',
+                zaxis_title=f'{label} Dimension 3'
             ),
             xaxis_title='',
             yaxis_title='',
-            legend=dict(
-                x=0.85,  # Move legend to the right side
-                y=1,
-                traceorder="normal",
-                font=dict(
-                    family="sans-serif",
-                    size=12,
-                    color="black"
-                ),
-            ),
+            # Clusters are encoded as point colors, so there are no per-cluster legend entries
+            showlegend=False,
             margin=dict(l=0, r=0, b=0, t=150),  # Increased top margin to ensure title visibility
             template="plotly_white"
         )
@@ -319,13 +383,21 @@ class EmbeddingVisualizer:
         os.makedirs(os.path.dirname(self.output_file), exist_ok=True)
         if os.path.exists(self.output_file):
             os.remove(self.output_file)
-        fig.write_html(self.output_file, auto_open=False)
+        # Reference plotly.js instead of embedding ~3.5MB of it in every file
+        include_plotlyjs = 'directory' if self.offline else 'cdn'
+        fig.write_html(self.output_file, auto_open=False, include_plotlyjs=include_plotlyjs, full_html=True)
 
         # Open in browser
         abs_path = os.path.abspath(self.output_file)
         print(f"Opening visualization in web browser: {abs_path}")
         webbrowser.open('file://' + abs_path)
 
+    def _cache_file(self, embeddings):
+        """Path of the cached layout for these embeddings and reduction parameters."""
+        digest = hashlib.sha256(np.ascontiguousarray(embeddings).tobytes())
+        digest.update(repr((self.random_seed, self.max_points, self.n_clusters, self.deterministic, self.reducer)).encode())
+        return os.path.join(CACHE_DIR, f"{self.collection_name}_{digest.hexdigest()[:16]}.npz")
+
     def run(self):
         """Run the full visualization process."""
         # Get embeddings from ChromaDB
@@ -334,11 +406,27 @@ class EmbeddingVisualizer:
         # Store original dimensions for title
         original_dims = embeddings.shape[1]
 
-        # Reduce dimensions for both 2D and 3D
-        embeddings_2d, embeddings_3d = self.reduce_dimensions(embeddings)
+        # Reuse the layout and clusters of a previous run on the same points, so
+        # iterating on e.g. the outlier threshold skips the reduction fit
+        cache_file = self._cache_file(embeddings)
+        if os.path.exists(cache_file):
+            print(f"Loading cached layout from {cache_file}")
+            with np.load(cache_file) as cached:
+                embeddings_2d, embeddings_3d, clusters = cached['embeddings_2d'], cached['embeddings_3d'], cached['clusters']
+        else:
+            # Reduce dimensions for both 2D and 3D
+            embeddings_2d, embeddings_3d = self.reduce_dimensions(embeddings)
+
+            # Cluster embeddings for coloring. Clusters only pick marker colors, so the
+            # 3D layout is used rather than the full-dimensional embeddings.
+            clusters = self.cluster_embeddings(embeddings_3d)
+
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            np.savez_compressed(cache_file, embeddings_2d=embeddings_2d, embeddings_3d=embeddings_3d, clusters=clusters)
 
-        # Cluster embeddings for coloring
-        clusters = self.cluster_embeddings(embeddings)
+        # Only the reduced coordinates are needed from here on
+        del embeddings
+        gc.collect()
 
         # Filter outliers
         embeddings_2d, embeddings_3d, documents, metadatas, ids, clusters = self.filter_outliers(
@@ -368,6 +456,12 @@ if __name__ == "__main__":
                         help="Number of clusters for coloring (default: 10)")
     parser.add_argument("--outlier-threshold", "-o", type=float, default=3.0,
                         help="Z-score threshold for outlier removal; lower values remove more outliers (default: 3.0)")
+    parser.add_argument("--deterministic", action="store_true",
+                        help="Seed UMAP for a reproducible layout (single-threaded; default: parallel, unseeded)")
+    parser.add_argument("--offline", action="store_true",
+                        help="Write a shared plotly.min.js next to the HTML instead of loading it from the CDN")
+    parser.add_argument("--reducer", "-r", default="umap", choices=list(REDUCER_LABELS),
+                        help="Dimensionality reduction backend; tsne needs openTSNE, pacmap needs pacmap (default: umap)")
 
     args = parser.parse_args()
 
@@ -377,6 +471,9 @@ if __name__ == "__main__":
         max_points=args.max_points,
         random_seed=args.seed,
         n_clusters=args.clusters,
-        outlier_threshold=args.outlier_threshold
+        outlier_threshold=args.outlier_threshold,
+        deterministic=args.deterministic,
+        offline=args.offline,
+        reducer=args.reducer
     )
     visualizer.run()
\ No newline at end of file
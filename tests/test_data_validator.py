@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""Tests for the sharded, multi-process mode of tools/data_validator.py."""
+
+import json
+import sys
+from pathlib import Path
+
+# tools/ is a directory of scripts, not a package
+TOOLS_DIR = Path(__file__).parent.parent / "tools"
+sys.path.insert(0, str(TOOLS_DIR))
+
+import data_validator  # noqa: E402
+
+
+def _write_fixture(tmp_path: Path) -> Path:
+    lines = []
+    for i in range(60):
+        lines.append(json.dumps({"id": f"doc_{i}", "text": f"document number {i} " * 3, "source": f"site_{i % 4}"}))
+        if i % 7 == 0:
+            lines.append("")
+        if i % 11 == 0:
+            lines.append("{not json")
+        if i % 13 == 0:
+            lines.append(json.dumps({"id": f"partial_{i}", "text": "missing its source"}))
+        if i % 9 == 0:
+            # Short text and an ID with invalid characters produce warnings
+            lines.append(json.dumps({"id": f"warn {i}", "text": "tiny", "source": "site_0"}))
+    # Repeat IDs from the start of the file near its end, so they land in a later shard
+    for i in (0, 1, 2, 30):
+        lines.append(json.dumps({"id": f"doc_{i}", "text": f"repeated document {i}", "source": "site_0"}))
+    # A repeat within the last shard
+    lines.append(json.dumps({"id": "doc_1", "text": "repeated again", "source": "site_1"}))
+
+    path = tmp_path / "data.jsonl"
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return path
+
+
+def _validate(path: Path, jobs: int) -> data_validator.DataValidator:
+    validator = data_validator.DataValidator(str(path), jobs=jobs)
+    validator.validate()
+    return validator
+
+
+def test_parallel_matches_sequential(tmp_path, monkeypatch, capsys):
+    path = _write_fixture(tmp_path)
+    # Shrink the shards so the small fixture is split across every worker
+    monkeypatch.setattr(data_validator, "SHARD_BYTES", 1024)
+    monkeypatch.setattr(data_validator, "COUNT_BLOCK", 100)
+
+    sequential = _validate(path, jobs=1)
+    parallel = _validate(path, jobs=3)
+    capsys.readouterr()
+
+    assert len(parallel._shard_bounds()) >= 3
+    assert parallel.errors == sequential.errors
+    assert parallel.warnings == sequential.warnings
+    assert parallel.error_count == sequential.error_count
+    assert parallel.warning_count == sequential.warning_count
+    assert parallel.stats == sequential.stats
+    assert sequential.stats["duplicate_ids"] == 5
+    assert parallel.text_length_counts == sequential.text_length_counts
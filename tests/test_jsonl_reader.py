@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""Tests for the streaming JSONL reader used by the vectorizer."""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+# Make the project modules importable
+PROJECT_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_DIR))
+
+from src.jsonl_reader import iter_jsonl  # noqa: E402
+
+
+def _read(tmp_path: Path, data: bytes):
+    path = tmp_path / "chunks.jsonl"
+    path.write_bytes(data)
+    with open(path, 'rb') as f:
+        return list(iter_jsonl(f))
+
+
+def test_skips_crlf_and_whitespace_only_lines(tmp_path):
+    data = (
+        b'{"id": "a", "text": "first", "source": "x"}\r\n'
+        b'\r\n'
+        b'   \n'
+        b'\t \r\n'
+        b'{"id": "b", "text": "second", "source": "y"}\n'
+        b'\n'
+    )
+    records = _read(tmp_path, data)
+
+    assert [record['id'] for record, _ in records] == ['a', 'b']
+    # Blank lines before a record are attributed to it; trailing ones to nobody
+    assert sum(size for _, size in records) == len(data) - 1
+
+
+def test_last_line_without_newline(tmp_path):
+    records = _read(tmp_path, b'{"id": "a", "text": "t", "source": "s"}\n  \n{"id": "b", "text": "t", "source": "s"}')
+
+    assert [record['id'] for record, _ in records] == ['a', 'b']
+
+
+def test_invalid_json_still_raises(tmp_path):
+    with pytest.raises(ValueError):
+        _read(tmp_path, b'{"id": "a", "text": "t", "source": "s"}\n{not json}\n')
+
+
+def test_empty_file(tmp_path):
+    assert _read(tmp_path, b'') == []
@@ -6,10 +6,16 @@ ChromaDB 集合管理工具
 
 import argparse
 import os
+from concurrent.futures import ThreadPoolExecutor
 import chromadb
 from typing import List, Dict, Any
 import json
 from datetime import datetime
+import numpy as np
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
 class CollectionManager:
@@ -33,9 +39,20 @@ class CollectionManager:
         
         collection_info = []
         
-        for i, collection in enumerate(collections, 1):
+        # 各集合的 count() 互不依赖，并发查询
+        def safe_count(collection):
             try:
-                count = collection.count()
+                return collection.count()
+            except Exception as e:
+                return e
+        
+        with ThreadPoolExecutor(max_workers=min(8, len(collections) or 1)) as executor:
+            counts = list(executor.map(safe_count, collections))
+        
+        for i, (collection, count) in enumerate(zip(collections, counts), 1):
+            try:
+                if isinstance(count, Exception):
+                    raise count
                 metadata = collection.metadata or {}
                 
                 info = {
@@ -82,14 +99,17 @@ class CollectionManager:
         # 获取样本数据
         sample_size = min(10, count)
         try:
+            # 只取第一条的嵌入用于判断维度，样本文档不再携带嵌入向量
+            first = collection.get(limit=1, include=['embeddings'])
             sample = collection.get(
                 limit=sample_size,
-                include=['embeddings', 'documents', 'metadatas']
+                include=['documents', 'metadatas']
             )
             
             # 分析嵌入维度
-            if sample['embeddings']:
-                embedding_dim = len(sample['embeddings'][0])
+            embedding_dim = None
+            if first['embeddings'] is not None and len(first['embeddings']) > 0:
+                embedding_dim = len(first['embeddings'][0])
                 print(f"  嵌入维度: {embedding_dim}")
             
             # 分析文档长度
@@ -116,7 +136,7 @@ class CollectionManager:
                 'name': collection_name,
                 'count': count,
                 'metadata': metadata,
-                'embedding_dim': embedding_dim if sample['embeddings'] else None,
+                'embedding_dim': embedding_dim,
                 'sample_doc_lengths': doc_lengths
             }
             
@@ -210,6 +230,13 @@ class CollectionManager:
                 include=['embeddings', 'documents', 'metadatas']
             )
             
+            # 嵌入向量单独保存为 float32 的 .npy 二进制文件，避免逐个浮点数序列化为文本
+            embeddings_file = f"{output_file}.embeddings.npy"
+            embeddings = data['embeddings']
+            if embeddings is None or len(embeddings) == 0:
+                embeddings = np.empty((0, 0), dtype=np.float32)
+            np.save(embeddings_file, np.asarray(embeddings, dtype=np.float32))
+            
             # 准备导出数据
             export_data = {
                 'collection_name': collection_name,
@@ -220,16 +247,21 @@ class CollectionManager:
                     'ids': data['ids'],
                     'documents': data['documents'],
                     'metadatas': data['metadatas'],
-                    'embeddings': data['embeddings']
+                    'embeddings_file': os.path.basename(embeddings_file)
                 }
             }
             
-            # 保存到文件
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(export_data, f, ensure_ascii=False, indent=2)
+            # 保存到文件（优先使用 orjson）
+            if orjson is not None:
+                with open(output_file, 'wb') as f:
+                    f.write(orjson.dumps(export_data))
+            else:
+                with open(output_file, 'w', encoding='utf-8') as f:
+                    json.dump(export_data, f, ensure_ascii=False)
             
             print(f"✅ 导出完成: {len(data['ids'])} 个文档")
             print(f"📄 文件大小: {os.path.getsize(output_file) / (1024*1024):.1f} MB")
+            print(f"🧮 嵌入文件: {embeddings_file} ({os.path.getsize(embeddings_file) / (1024*1024):.1f} MB)")
             return True
             
         except Exception as e:
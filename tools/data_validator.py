@@ -6,19 +6,96 @@
 
 import json
 import argparse
+import hashlib
+import heapq
+import mmap
 import os
 from typing import Dict, List, Any
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from operator import itemgetter
 import re
+import numpy as np
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    orjson = None
+    _loads = json.loads
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+try:
+    import xxhash
+    _id_hash = xxhash.xxh3_64_intdigest
+except ImportError:
+    def _id_hash(doc_id: str) -> int:
+        """没有 xxhash 时用 8 字节 blake2b 作为 64 位 ID 哈希"""
+        digest = hashlib.blake2b(doc_id.encode('utf-8', 'surrogatepass'), digest_size=8).digest()
+        return int.from_bytes(digest, 'little')
+
+# 预编译的正则表达式，避免每行查询 re 模块缓存
+# ID 检查用 fullmatch 代替锚点，直接绑定方法省去每次属性查找
+_id_fullmatch = re.compile(r'[a-zA-Z0-9_-]+').fullmatch
+# 数字先替换为 N 再与相邻字母一起替换为 A，等价于把字母数字串整体替换为 A
+_ALNUM_RE = re.compile(r'[a-zA-Z\d]+')
+
+# 并行验证时每个分片的大致字节数
+SHARD_BYTES = 64 << 20
+# 计算分片起始行号时每次统计换行的字节数，避免整片复制
+COUNT_BLOCK = 1 << 20
+# 最多保存的错误/警告条数，超出部分只计数（报告只打印前 10 条）
+MAX_STORED_PROBLEMS = 10_000
+# 文本长度和字符串模式先缓冲到列表，每满一块再批量计入统计
+STATS_BLOCK = 65536
+
+# 错误/警告以 (代码, 行号, 详情) 元组保存，生成报告时才格式化
+ERR_FILE_MISSING = 0
+ERR_JSON = 1
+ERR_MISSING_FIELDS = 2
+ERR_DUPLICATE_ID = 3
+WARN_NOT_STRING = 4
+WARN_EMPTY_FIELD = 5
+WARN_TOO_SHORT = 6
+WARN_TOO_LONG = 7
+WARN_ID_CHARS = 8
+
+_PROBLEM_FORMATS = {
+    ERR_FILE_MISSING: "文件不存在: {1}",
+    ERR_JSON: "第 {0} 行 JSON 解析错误: {1}",
+    ERR_MISSING_FIELDS: "第 {0} 行缺少字段: {1}",
+    ERR_DUPLICATE_ID: "第 {0} 行重复的ID: {1}",
+    WARN_NOT_STRING: "第 {0} 行 '{1}' 字段应为字符串类型",
+    WARN_EMPTY_FIELD: "第 {0} 行 '{1}' 字段为空",
+    WARN_TOO_SHORT: "第 {0} 行文本过短 ({1} 字符)",
+    WARN_TOO_LONG: "第 {0} 行文本过长 ({1} 字符)",
+    WARN_ID_CHARS: "第 {0} 行ID包含特殊字符: {1}",
+}
+
+# 快速路径：msgspec 在解析时直接完成必需字段和字符串类型检查
+if msgspec is not None:
+    class _Doc(msgspec.Struct):
+        id: str
+        text: str
+        source: str
+
+    _decode_doc = msgspec.json.Decoder(_Doc).decode
+else:
+    _decode_doc = None
 
 
 class DataValidator:
     """JSONL 数据验证器"""
     
-    def __init__(self, file_path: str):
+    def __init__(self, file_path: str, jobs: int = 1):
         self.file_path = file_path
+        self.jobs = jobs
         self.errors = []
         self.warnings = []
+        self.error_count = 0
+        self.warning_count = 0
         self.stats = {
             'total_lines': 0,
             'valid_docs': 0,
@@ -26,61 +103,185 @@ class DataValidator:
             'json_errors': 0,
             'missing_fields': 0,
             'duplicate_ids': 0,
-            'text_lengths': [],
             'id_patterns': Counter(),
             'source_patterns': Counter()
         }
+        # 文本长度按长度值计数，内存只随不同长度的数量增长，且可精确求中位数
+        self.text_length_counts = Counter()
+        self.text_length_sum = 0
+        self._length_block = []
+        self._id_pattern_block = []
+        self._source_pattern_block = []
+        # ID 的 64 位哈希 -> 首次出现的行号，分片合并时据此判断跨分片重复
+        # （只存整数不存原始字符串以节省内存，百万级 ID 下碰撞概率可忽略）
+        self.seen_ids = {}
     
     def validate(self) -> Dict[str, Any]:
         """执行完整的数据验证"""
         print(f"🔍 验证数据文件: {self.file_path}")
         print("=" * 50)
         
-        # 检查文件是否存在
-        if not os.path.exists(self.file_path):
-            self.errors.append(f"文件不存在: {self.file_path}")
+        # 检查文件是否存在（只 stat 一次，大小同时用于选择验证方式）
+        try:
+            file_size = os.stat(self.file_path).st_size
+        except OSError:
+            self._error(ERR_FILE_MISSING, 0, self.file_path)
             return self._generate_report()
         
-        # 验证每行数据
-        seen_ids = set()
+        # 验证每行数据（空文件无需读取，也无法 mmap）
+        if file_size == 0:
+            pass
+        elif self.jobs > 1 and file_size > SHARD_BYTES:
+            self._validate_parallel()
+        else:
+            self._validate_file()
         
-        with open(self.file_path, 'r', encoding='utf-8') as f:
-            for line_num, line in enumerate(f, 1):
-                self.stats['total_lines'] += 1
-                
-                # 跳过空行
-                if not line.strip():
-                    self.stats['empty_lines'] += 1
+        # 生成报告
+        return self._generate_report()
+    
+    def _validate_file(self):
+        """内存映射整个文件并逐行验证，行字节直接交给解析器"""
+        with open(self.file_path, 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # mmap.readline 在映射内存上用 memchr 查找换行，不经过读缓冲
+            self._validate_lines(iter(mm.readline, b''), 1)
+    
+    def _validate_lines(self, lines, first_line: int):
+        """逐行验证，first_line 为第一行在文件中的行号"""
+        # 热循环中用局部变量代替属性和字典查找，逐行计数在循环结束后写回
+        stats = self.stats
+        seen_ids = self.seen_ids
+        decode_doc = _decode_doc
+        validate_fields = self._validate_fields
+        collect_stats = self._collect_stats
+        valid_docs = 0
+        line_num = first_line - 1
+        for line_num, line in enumerate(lines, first_line):
+            # 快速路径：结构符合要求的行一次解析即完成校验
+            doc = None
+            if decode_doc is not None:
+                try:
+                    doc = decode_doc(line)
+                except msgspec.DecodeError:
+                    # JSON 错误、缺少字段或类型不符交给慢路径给出详细信息
+                    pass
+            
+            if doc is not None:
+                doc_id, text, source = doc.id, doc.text, doc.source
+                validate_fields(doc_id, text, source, line_num)
+            else:
+                # 跳过空行（合法文档不会为空，只需在快速路径失败后检查；isspace 不分配新对象）
+                if line.isspace():
+                    stats['empty_lines'] += 1
                     continue
                 
                 # 验证JSON格式
+                # ValueError 同时覆盖 JSON 语法错误和非法 UTF-8
                 try:
-                    data = json.loads(line)
-                except json.JSONDecodeError as e:
-                    self.stats['json_errors'] += 1
-                    self.errors.append(f"第 {line_num} 行 JSON 解析错误: {e}")
+                    data = _loads(line)
+                except ValueError as e:
+                    stats['json_errors'] += 1
+                    self._error(ERR_JSON, line_num, str(e))
                     continue
                 
                 # 验证数据结构
                 validation_result = self._validate_document(data, line_num)
-                if validation_result['valid']:
-                    self.stats['valid_docs'] += 1
-                    
-                    # 检查ID重复
-                    doc_id = data['id']
-                    if doc_id in seen_ids:
-                        self.stats['duplicate_ids'] += 1
-                        self.errors.append(f"第 {line_num} 行重复的ID: {doc_id}")
-                    else:
-                        seen_ids.add(doc_id)
-                    
-                    # 收集统计信息
-                    self._collect_stats(data)
-                else:
-                    self.stats['missing_fields'] += 1
+                if not validation_result['valid']:
+                    stats['missing_fields'] += 1
+                    continue
+                doc_id, text, source = data['id'], data['text'], data['source']
+            
+            valid_docs += 1
+            
+            # 检查ID重复（setdefault 返回已有行号即为重复，只需一次哈希查找）
+            if seen_ids.setdefault(_id_hash(doc_id), line_num) != line_num:
+                stats['duplicate_ids'] += 1
+                self._error(ERR_DUPLICATE_ID, line_num, doc_id)
+            
+            # 收集统计信息
+            collect_stats(doc_id, text, source)
         
-        # 生成报告
-        return self._generate_report()
+        stats['total_lines'] += line_num - first_line + 1
+        stats['valid_docs'] += valid_docs
+        self._flush_stats()
+    
+    def _shard_bounds(self) -> List[tuple]:
+        """在换行处把文件切成约 SHARD_BYTES 大小的分片，返回 (起始偏移, 结束偏移, 起始行号)"""
+        bounds = []
+        with open(self.file_path, 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            size = len(mm)
+            start, first_line = 0, 1
+            while start < size:
+                nl = mm.find(b'\n', start + SHARD_BYTES)
+                end = size if nl == -1 else nl + 1
+                bounds.append((start, end, first_line))
+                # 分块统计换行，每次只复制 COUNT_BLOCK 字节
+                for pos in range(start, end, COUNT_BLOCK):
+                    first_line += mm[pos:min(pos + COUNT_BLOCK, end)].count(b'\n')
+                start = end
+        return bounds
+    
+    def _validate_parallel(self):
+        """多进程验证各分片，并按文件顺序合并结果"""
+        bounds = self._shard_bounds()
+        print(f"⚙️  使用 {self.jobs} 个进程验证 {len(bounds)} 个分片")
+        with ProcessPoolExecutor(max_workers=self.jobs) as pool:
+            futures = [pool.submit(_validate_shard, self.file_path, *b) for b in bounds]
+            for bound, future in zip(bounds, futures):
+                self._merge(future.result(), bound[0], bound[2])
+    
+    def _merge(self, part: 'DataValidator', start: int, first_line: int):
+        """合并一个分片的验证结果（需按分片顺序调用）"""
+        for key, value in part.stats.items():
+            self.stats[key] += value
+        self.text_length_counts.update(part.text_length_counts)
+        self.text_length_sum += part.text_length_sum
+        self.error_count += part.error_count
+        self.warning_count += part.warning_count
+        self.warnings.extend(part.warnings[:MAX_STORED_PROBLEMS - len(self.warnings)])
+        
+        # 分片内的首次出现若已在之前的分片出现过，则为跨分片重复
+        seen_ids = self.seen_ids
+        dup_lines = [line_num for id_hash, line_num in part.seen_ids.items()
+                     if seen_ids.setdefault(id_hash, line_num) != line_num]
+        self.stats['duplicate_ids'] += len(dup_lines)
+        self.error_count += len(dup_lines)
+        
+        room = MAX_STORED_PROBLEMS - len(self.errors)
+        dup_errors = []
+        if dup_lines and room > 0:
+            doc_ids = self._ids_at_lines(start, first_line, dup_lines)
+            dup_errors = [(ERR_DUPLICATE_ID, line_num, doc_ids[line_num]) for line_num in dup_lines]
+        # 跨分片重复与分片内的错误按行号归并，保持文件顺序
+        errors = heapq.merge(part.errors, dup_errors, key=itemgetter(1))
+        self.errors.extend(islice(errors, room))
+    
+    def _ids_at_lines(self, start: int, first_line: int, line_nums: List[int]) -> Dict[int, str]:
+        """从分片起点重新读取，取回指定行的原始 ID（仅在跨分片重复时使用）"""
+        wanted = set(line_nums)
+        last_line = max(wanted)
+        doc_ids = {}
+        with open(self.file_path, 'rb') as f:
+            f.seek(start)
+            for line_num, line in enumerate(f, first_line):
+                if line_num in wanted:
+                    doc_ids[line_num] = _loads(line)['id']
+                if line_num >= last_line:
+                    break
+        return doc_ids
+    
+    def _error(self, code: int, line_num: int, detail: Any):
+        """记录一条错误"""
+        self.error_count += 1
+        if len(self.errors) < MAX_STORED_PROBLEMS:
+            self.errors.append((code, line_num, detail))
+    
+    def _warning(self, code: int, line_num: int, detail: Any):
+        """记录一条警告"""
+        self.warning_count += 1
+        if len(self.warnings) < MAX_STORED_PROBLEMS:
+            self.warnings.append((code, line_num, detail))
     
     def _validate_document(self, data: Dict, line_num: int) -> Dict[str, Any]:
         """验证单个文档的格式"""
@@ -92,65 +293,95 @@ class DataValidator:
             if field not in data:
                 missing_fields.append(field)
             elif not isinstance(data[field], str):
-                self.warnings.append(f"第 {line_num} 行 '{field}' 字段应为字符串类型")
+                self._warning(WARN_NOT_STRING, line_num, field)
             elif not data[field].strip():
-                self.warnings.append(f"第 {line_num} 行 '{field}' 字段为空")
+                self._warning(WARN_EMPTY_FIELD, line_num, field)
         
         if missing_fields:
-            self.errors.append(f"第 {line_num} 行缺少字段: {', '.join(missing_fields)}")
+            self._error(ERR_MISSING_FIELDS, line_num, ', '.join(missing_fields))
             return {'valid': False, 'missing_fields': missing_fields}
         
+        self._check_content(data['id'], data['text'], line_num)
+        return {'valid': True}
+    
+    def _validate_fields(self, doc_id: str, text: str, source: str, line_num: int):
+        """验证已确认为字符串的字段（快速路径）"""
+        for field, value in (('id', doc_id), ('text', text), ('source', source)):
+            if not value.strip():
+                self._warning(WARN_EMPTY_FIELD, line_num, field)
+        self._check_content(doc_id, text, line_num)
+    
+    def _check_content(self, doc_id: str, text: str, line_num: int):
+        """检查文本长度和ID格式"""
         # 检查文本长度
-        text_length = len(data['text'])
+        text_length = len(text)
         if text_length < 10:
-            self.warnings.append(f"第 {line_num} 行文本过短 ({text_length} 字符)")
+            self._warning(WARN_TOO_SHORT, line_num, text_length)
         elif text_length > 16384:
-            self.warnings.append(f"第 {line_num} 行文本过长 ({text_length} 字符)")
+            self._warning(WARN_TOO_LONG, line_num, text_length)
         
         # 检查ID格式
-        if not re.match(r'^[a-zA-Z0-9_-]+$', data['id']):
-            self.warnings.append(f"第 {line_num} 行ID包含特殊字符: {data['id']}")
-        
-        return {'valid': True}
+        if not _id_fullmatch(doc_id):
+            self._warning(WARN_ID_CHARS, line_num, doc_id)
     
-    def _collect_stats(self, data: Dict):
+    def _collect_stats(self, doc_id: str, text: str, source: str):
         """收集数据统计信息"""
         # 文本长度统计
-        self.stats['text_lengths'].append(len(data['text']))
+        lengths = self._length_block
+        lengths.append(len(text))
         
         # ID模式统计
-        id_pattern = self._extract_pattern(data['id'])
-        self.stats['id_patterns'][id_pattern] += 1
+        self._id_pattern_block.append(self._extract_pattern(doc_id))
         
         # Source模式统计
-        source_pattern = self._extract_pattern(data['source'])
-        self.stats['source_patterns'][source_pattern] += 1
+        self._source_pattern_block.append(self._extract_pattern(source))
+        
+        if len(lengths) >= STATS_BLOCK:
+            self._flush_stats()
+    
+    def _flush_stats(self):
+        """把缓冲的文本长度和模式批量计入统计"""
+        if not self._length_block:
+            return
+        lengths = np.array(self._length_block, dtype=np.int64)
+        # np.unique 按排序计数，不会像 bincount 那样按最大长度分配数组
+        values, counts = np.unique(lengths, return_counts=True)
+        self.text_length_counts.update(dict(zip(values.tolist(), counts.tolist())))
+        self.text_length_sum += int(lengths.sum())
+        self._length_block.clear()
+        
+        # Counter.update 对可迭代对象走 C 实现的计数循环
+        self.stats['id_patterns'].update(self._id_pattern_block)
+        self.stats['source_patterns'].update(self._source_pattern_block)
+        self._id_pattern_block.clear()
+        self._source_pattern_block.clear()
     
     def _extract_pattern(self, text: str) -> str:
         """提取字符串模式"""
-        # 将数字替换为N，字母替换为A
-        pattern = re.sub(r'\d+', 'N', text)
-        pattern = re.sub(r'[a-zA-Z]+', 'A', pattern)
-        return pattern
+        # 字母数字串整体替换为A（单次扫描完成）
+        return _ALNUM_RE.sub('A', text)
     
     def _generate_report(self) -> Dict[str, Any]:
         """生成验证报告"""
         report = {
             'file_path': self.file_path,
-            'validation_passed': len(self.errors) == 0,
-            'stats': self.stats.copy(),
-            'errors': self.errors.copy(),
-            'warnings': self.warnings.copy()
+            'validation_passed': self.error_count == 0,
+            # 报告生成是验证的最后一步，直接引用而不复制；问题条目此时才格式化
+            'stats': self.stats,
+            'error_count': self.error_count,
+            'warning_count': self.warning_count,
+            'errors': [_format_problem(p) for p in self.errors],
+            'warnings': [_format_problem(p) for p in self.warnings]
         }
         
         # 计算文本长度统计
-        if self.stats['text_lengths']:
-            lengths = self.stats['text_lengths']
+        if self.text_length_counts:
+            count = self.stats['valid_docs']
             report['stats']['text_length_stats'] = {
-                'min': min(lengths),
-                'max': max(lengths),
-                'avg': sum(lengths) / len(lengths),
-                'median': sorted(lengths)[len(lengths) // 2]
+                'min': min(self.text_length_counts),
+                'max': max(self.text_length_counts),
+                'avg': self.text_length_sum / count,
+                'median': self._length_median(count // 2)
             }
         
         # 打印报告
@@ -158,6 +389,14 @@ class DataValidator:
         
         return report
     
+    def _length_median(self, rank: int) -> int:
+        """按长度顺序累计计数，返回排序后第 rank 个文本长度"""
+        seen = 0
+        for length in sorted(self.text_length_counts):
+            seen += self.text_length_counts[length]
+            if seen > rank:
+                return length
+    
     def _print_report(self, report: Dict):
         """打印验证报告"""
         stats = report['stats']
@@ -190,20 +429,20 @@ class DataValidator:
                 print(f"  {pattern}: {count} 次")
         
         # 显示错误
-        if report['errors']:
-            print(f"\n❌ 错误 ({len(report['errors'])} 个):")
+        if report['error_count']:
+            print(f"\n❌ 错误 ({report['error_count']} 个):")
             for error in report['errors'][:10]:  # 只显示前10个错误
                 print(f"  {error}")
-            if len(report['errors']) > 10:
-                print(f"  ... 还有 {len(report['errors']) - 10} 个错误")
+            if report['error_count'] > 10:
+                print(f"  ... 还有 {report['error_count'] - 10} 个错误")
         
         # 显示警告
-        if report['warnings']:
-            print(f"\n⚠️  警告 ({len(report['warnings'])} 个):")
+        if report['warning_count']:
+            print(f"\n⚠️  警告 ({report['warning_count']} 个):")
             for warning in report['warnings'][:10]:  # 只显示前10个警告
                 print(f"  {warning}")
-            if len(report['warnings']) > 10:
-                print(f"  ... 还有 {len(report['warnings']) - 10} 个警告")
+            if report['warning_count'] > 10:
+                print(f"  ... 还有 {report['warning_count'] - 10} 个警告")
         
         # 验证结果
         print(f"\n{'=' * 50}")
@@ -224,21 +463,46 @@ class DataValidator:
                 print("  - 文档平均长度较长，建议考虑分段处理")
 
 
+def _format_problem(problem: tuple) -> str:
+    """把 (代码, 行号, 详情) 元组格式化为报告中的文字"""
+    code, line_num, detail = problem
+    return _PROBLEM_FORMATS[code].format(line_num, detail)
+
+
+def _validate_shard(file_path: str, start: int, end: int, first_line: int) -> DataValidator:
+    """子进程入口：验证 [start, end) 字节范围内的行"""
+    part = DataValidator(file_path)
+    # 只映射分片所在的字节范围（映射起点需按分配粒度对齐），readline 读到 end 即返回 b''
+    offset = start - start % mmap.ALLOCATIONGRANULARITY
+    with open(file_path, 'rb') as f, \
+            mmap.mmap(f.fileno(), end - offset, access=mmap.ACCESS_READ, offset=offset) as mm:
+        mm.seek(start - offset)
+        part._validate_lines(iter(mm.readline, b''), first_line)
+    return part
+
+
 def main():
     parser = argparse.ArgumentParser(description="验证 JSONL 训练数据格式")
     parser.add_argument("file_path", help="JSONL 数据文件路径")
     parser.add_argument("--output", "-o", help="将验证报告保存到 JSON 文件")
+    parser.add_argument("--jobs", "-j", type=int, default=1,
+                       help="并行验证的进程数（大于 1 时按约 64 MB 分片处理）")
     
     args = parser.parse_args()
     
     # 执行验证
-    validator = DataValidator(args.file_path)
+    validator = DataValidator(args.file_path, jobs=args.jobs)
     report = validator.validate()
     
     # 保存报告（如果指定）
     if args.output:
-        with open(args.output, 'w', encoding='utf-8') as f:
-            json.dump(report, f, ensure_ascii=False, indent=2)
+        # 优先使用 orjson 直接写出 UTF-8 字节
+        if orjson is not None:
+            with open(args.output, 'wb') as f:
+                f.write(orjson.dumps(report, option=orjson.OPT_INDENT_2))
+        else:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
         print(f"\n📄 验证报告已保存到: {args.output}")
     
     # 返回适当的退出码